@@ -0,0 +1,329 @@
+# An in-process stand-in for Discord's gateway and REST API, for benchmarking goose_bot without a network.
+# The REST side replaces the aiohttp session inside discord.py's HTTPClient, so every request still goes through
+# discord.py's own routing, locking and 429 handling. The gateway side feeds event payloads to the bot's
+# ConnectionState parsers, exactly as the websocket would.
+
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import unquote
+
+import discord
+from discord.http import Route
+from discord.state import ChunkRequest
+
+DEFAULT_PERMISSIONS = str(discord.Permissions.general().value | discord.Permissions.text().value)
+ADMIN_PERMISSIONS = str(discord.Permissions.all().value)
+
+
+# Allows `limit` requests per `per` seconds in each bucket.
+class RateLimit:
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+
+
+class Bucket:
+    def __init__(self, rate_limit):
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit.limit
+        self.reset_at = 0.0
+
+    # Take a request from the bucket. Returns how long to wait if the bucket is empty, else None.
+    def take(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.rate_limit.limit
+            self.reset_at = now + self.rate_limit.per
+        if self.remaining <= 0:
+            return self.reset_at - now
+        self.remaining -= 1
+        return None
+
+
+class FakeResponse:
+    def __init__(self, status, data=None, headers=None):
+        self.status = status
+        self.reason = HTTPStatus(status).phrase  # discord.py puts it in the message of its HTTPExceptions.
+        # Like Discord, an empty response (204) has no JSON content type, so discord.py doesn't try to parse it.
+        self.headers = {} if data is None else {"content-type": "application/json"}
+        self.headers.update(headers or {})
+        self.body = "" if data is None else json.dumps(data)
+
+    async def text(self, encoding="utf-8"):
+        return self.body
+
+
+class FakeRequest:
+    def __init__(self, discord_stand_in, method, url, kwargs):
+        self.discord_stand_in = discord_stand_in
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+    async def __aenter__(self):
+        return await self.discord_stand_in.handle(self.method, self.url, self.kwargs)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+# Takes the place of aiohttp.ClientSession inside discord.py's HTTPClient.
+class FakeSession:
+    closed = False
+
+    def __init__(self, discord_stand_in):
+        self.discord_stand_in = discord_stand_in
+
+    def request(self, method, url, **kwargs):
+        return FakeRequest(self.discord_stand_in, method, url, kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeDiscord:
+    def __init__(self, latency=0.02, jitter=0.01, gateway_latency=0.01, rate_limit=RateLimit(50, 1.0),
+                 route_rate_limits=None, global_rate_limit=RateLimit(500, 1.0)):
+        self.latency = latency
+        self.jitter = jitter
+        self.gateway_latency = gateway_latency
+        self.rate_limit = rate_limit
+        # (method, regex over the path) -> (RateLimit, bucket key function), for buckets discord.py can't predict.
+        self.route_rate_limits = route_rate_limits or {}
+        self.global_bucket = Bucket(global_rate_limit)
+        self.buckets = {}
+        self.state = None
+        self.last_id = 0
+        self.guilds = {}  # guild_id -> {"roles": {id: data}, "members": {id: data}, "channels": {id: data}}
+        self.messages = {}  # message_id -> (channel_id, content)
+        self.requests = Counter()  # (method, route) -> count
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.message_log = []  # (time, channel_id, content), for measuring reply latency
+        self.member_edit_log = []  # (time, guild_id, member_id)
+        self.deleted_messages = 0
+
+    def next_id(self):
+        self.last_id = max(self.last_id + 1, discord.utils.time_snowflake(datetime.utcnow()))
+        return self.last_id
+
+    # Point a discord.py client at the stand-in and fill its cache as if it had just connected.
+    # Like Discord, GUILD_CREATE can be limited to the first `guild_create_member_limit` members of a large guild;
+    # the rest then only reach the client through chunk_guild.
+    def install(self, client, guilds, guild_create_member_limit=None):
+        client.http._HTTPClient__session = FakeSession(self)
+        client.http.token = "fake-token"
+        client.http.bot_token = True
+        self.state = state = client._connection
+        bot_user = {"id": str(self.next_id()), "username": "Goose Bot", "discriminator": "0001", "avatar": None,
+                    "bot": True}
+        state.user = discord.ClientUser(state=state, data=bot_user)
+        for guild in guilds:
+            guild["members"].append(self.make_member(bot_user, [guild["admin_role_id"]]))
+            self.guilds[int(guild["id"])] = {
+                "roles": {int(r["id"]): r for r in guild["roles"]},
+                "members": {int(m["user"]["id"]): m for m in guild["members"]},
+                "channels": {int(c["id"]): c for c in guild["channels"]},
+            }
+            if guild_create_member_limit is not None:
+                guild = dict(guild, members=guild["members"][-1:] + guild["members"][:guild_create_member_limit - 1],
+                             large=True)
+            state._add_guild_from_data(guild)
+        client._ready.set()
+
+    # Send a guild's members over the gateway in GUILD_MEMBERS_CHUNK events, as Discord answers discord.py's request
+    # to chunk a guild at startup. Returns once the client has processed the last chunk.
+    async def chunk_guild(self, guild_id, chunk_size=1000):
+        request = ChunkRequest(guild_id, self.state.loop, self.state._get_guild, cache=True)
+        self.state._chunk_requests[request.nonce] = request
+        finished = request.get_future()
+        members = list(self.guilds[guild_id]["members"].values())
+        chunk_count = max(1, -(-len(members) // chunk_size))
+        for chunk_index in range(chunk_count):
+            await asyncio.sleep(self.gateway_latency)
+            self.dispatch("GUILD_MEMBERS_CHUNK", {
+                "guild_id": str(guild_id), "nonce": request.nonce, "chunk_index": chunk_index,
+                "chunk_count": chunk_count, "members": members[chunk_index * chunk_size:(chunk_index + 1) * chunk_size],
+            })
+        return await finished
+
+    # Build a guild with the given numbers of roles, members and text channels.
+    def make_guild(self, name, role_count, member_count, channel_count, member_role_count=3):
+        guild_id = str(self.next_id())
+        roles = [{"id": guild_id, "name": "@everyone", "position": 0, "permissions": DEFAULT_PERMISSIONS,
+                  "color": 0, "hoist": False, "managed": False, "mentionable": False}]
+        for position in range(1, role_count + 1):
+            roles.append({"id": str(self.next_id()), "name": "role-" + str(position), "position": position,
+                          "permissions": DEFAULT_PERMISSIONS, "color": 0, "hoist": False, "managed": False,
+                          "mentionable": False})
+        admin_role_id = str(self.next_id())
+        roles.append({"id": admin_role_id, "name": "Goose Bot", "position": role_count + 1,
+                      "permissions": ADMIN_PERMISSIONS, "color": 0, "hoist": False, "managed": False,
+                      "mentionable": False})
+        members = []
+        for number in range(member_count):
+            user = {"id": str(self.next_id()), "username": "member" + str(number), "discriminator": "0001",
+                    "avatar": None}
+            member_roles = [r["id"] for r in random.sample(roles[1:-1], min(member_role_count, role_count))]
+            members.append(self.make_member(user, member_roles))
+        channels = [{"id": str(self.next_id()), "type": 0, "name": "channel-" + str(number), "position": number,
+                     "permission_overwrites": []} for number in range(channel_count)]
+        return {"id": guild_id, "name": name, "owner_id": members[0]["user"]["id"] if members else None,
+                "member_count": member_count + 1, "roles": roles, "members": members, "channels": channels,
+                "emojis": [], "features": [], "admin_role_id": admin_role_id}
+
+    def make_member(self, user, roles):
+        return {"user": user, "roles": list(roles), "joined_at": "2022-01-01T00:00:00+00:00", "deaf": False,
+                "mute": False, "nick": None}
+
+    # Gateway events.
+
+    def dispatch(self, event, data):
+        self.state.parsers[event](data)
+
+    def dispatch_later(self, event, data):
+        self.state.loop.call_later(self.gateway_latency, self.dispatch, event, data)
+
+    def reaction(self, add, guild_id, channel_id, message_id, user_id, emoji_name, emoji_id=None):
+        data = {"guild_id": str(guild_id), "channel_id": str(channel_id), "message_id": str(message_id),
+                "user_id": str(user_id), "emoji": {"id": emoji_id and str(emoji_id), "name": emoji_name}}
+        if add:
+            data["member"] = self.guilds[guild_id]["members"][user_id]
+            self.dispatch("MESSAGE_REACTION_ADD", data)
+        else:
+            self.dispatch("MESSAGE_REACTION_REMOVE", data)
+
+    def user_message(self, guild_id, channel_id, user_id, content):
+        member = self.guilds[guild_id]["members"][user_id]
+        data = {"id": str(self.next_id()), "channel_id": str(channel_id), "guild_id": str(guild_id),
+                "author": member["user"], "member": {k: v for k, v in member.items() if k != "user"},
+                "content": content, "timestamp": datetime.utcnow().isoformat() + "+00:00",
+                "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [],
+                "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0}
+        self.dispatch("MESSAGE_CREATE", data)
+
+    # REST API.
+
+    def bucket_for(self, method, path):
+        for (route_method, pattern), (rate_limit, key) in self.route_rate_limits.items():
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                bucket_key = (route_method, pattern, key(match))
+                break
+        else:
+            # Like Discord, bucket by route with the major parameter (channel or guild) kept in.
+            major = re.sub(r"/(messages|members|roles|reactions)/[^/]+", r"/\1/{id}", path)
+            bucket_key = (method, major)
+            rate_limit = self.rate_limit
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self.buckets[bucket_key] = Bucket(rate_limit)
+        return bucket
+
+    async def handle(self, method, url, kwargs):
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+            path = unquote(url[len(Route.BASE):].split("?")[0])
+            now = time.monotonic()
+            retry_after = self.global_bucket.take(now)
+            is_global = retry_after is not None
+            bucket = self.bucket_for(method, path)
+            if retry_after is None:
+                retry_after = bucket.take(now)
+            if retry_after is not None:
+                self.rate_limited += 1
+                return FakeResponse(429, {"message": "You are being rate limited.", "retry_after": retry_after * 1000,
+                                          "global": is_global}, {"Via": "1.1 fake-discord"})
+            body = kwargs.get("data")
+            payload = json.loads(body) if isinstance(body, str) and body else {}
+            status, data, route = self.route(method, path, payload)
+            self.requests[(method, route)] += 1
+            headers = {"X-Ratelimit-Limit": str(bucket.rate_limit.limit),
+                       "X-Ratelimit-Remaining": str(bucket.remaining),
+                       "X-Ratelimit-Reset-After": "%.3f" % max(0.0, bucket.reset_at - time.monotonic())}
+            return FakeResponse(status, data, headers)
+        finally:
+            self.in_flight -= 1
+
+    def route(self, method, path, payload):
+        parts = path.strip("/").split("/")
+        if parts[0] == "channels":
+            channel_id = int(parts[1])
+            if method == "POST" and parts[2:] == ["messages"]:
+                return 200, self.create_message(channel_id, payload.get("content", "")), "create_message"
+            if method == "POST" and parts[2:] == ["messages", "bulk-delete"]:
+                for message_id in payload.get("messages", []):
+                    self.delete_message(int(message_id))
+                return 204, None, "bulk_delete"
+            if len(parts) == 4 and parts[2] == "messages":
+                message_id = int(parts[3])
+                if message_id not in self.messages:
+                    return 404, {"message": "Unknown Message", "code": 10008}, "unknown_message"
+                if method == "DELETE":
+                    self.delete_message(message_id)
+                    return 204, None, "delete_message"
+                if method == "PATCH":
+                    self.messages[message_id] = (channel_id, payload.get("content", ""))
+                    return 200, self.message_data(message_id, channel_id, payload.get("content", "")), "edit_message"
+            if len(parts) >= 6 and parts[4] == "reactions":
+                return 204, None, "add_reaction" if method == "PUT" else "remove_reaction"
+        if parts[0] == "guilds":
+            guild = self.guilds.get(int(parts[1]))
+            if guild is None:
+                return 404, {"message": "Unknown Guild", "code": 10004}, "unknown_guild"
+            if len(parts) >= 4 and parts[2] == "members":
+                member = guild["members"].get(int(parts[3]))
+                if member is None:
+                    return 404, {"message": "Unknown Member", "code": 10007}, "unknown_member"
+                if method == "GET" and len(parts) == 4:
+                    return 200, member, "get_member"
+                if method == "PATCH" and len(parts) == 4:
+                    if "roles" in payload:
+                        member["roles"] = [str(role_id) for role_id in payload["roles"]]
+                    self.member_updated(int(parts[1]), member)
+                    return 200, member, "edit_member"
+                if len(parts) == 6 and parts[4] == "roles":
+                    if method == "PUT" and parts[5] not in member["roles"]:
+                        member["roles"].append(parts[5])
+                    elif method == "DELETE" and parts[5] in member["roles"]:
+                        member["roles"].remove(parts[5])
+                    self.member_updated(int(parts[1]), member)
+                    return 204, None, "add_role" if method == "PUT" else "remove_role"
+        return 404, {"message": "404: Not Found", "code": 0}, "not_found"
+
+    def message_data(self, message_id, channel_id, content):
+        author = {"id": str(self.state.user.id), "username": self.state.user.name, "discriminator": "0001",
+                  "avatar": None, "bot": True}
+        return {"id": str(message_id), "channel_id": str(channel_id), "author": author, "content": content,
+                "timestamp": datetime.utcnow().isoformat() + "+00:00", "edited_timestamp": None, "tts": False,
+                "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+                "pinned": False, "type": 0}
+
+    def create_message(self, channel_id, content):
+        message_id = self.next_id()
+        self.messages[message_id] = (channel_id, content)
+        self.message_log.append((time.perf_counter(), channel_id, content))
+        return self.message_data(message_id, channel_id, content)
+
+    def delete_message(self, message_id):
+        if self.messages.pop(message_id, None) is not None:
+            self.deleted_messages += 1
+
+    # Echo a member change back over the gateway, as Discord does.
+    def member_updated(self, guild_id, member):
+        self.member_edit_log.append((time.perf_counter(), guild_id, int(member["user"]["id"])))
+        data = dict(member, guild_id=str(guild_id))
+        self.dispatch_later("GUILD_MEMBER_UPDATE", data)
+
+    def reset_counters(self):
+        self.requests.clear()
+        self.rate_limited = 0
+        self.message_log.clear()
+        self.member_edit_log.clear()
+        self.deleted_messages = 0
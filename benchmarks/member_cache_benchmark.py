@@ -0,0 +1,190 @@
+# Compares goose_bot's full member cache with the lazy member mode (LAZY_MEMBERS=1) on one large synthetic guild.
+# Each mode runs in its own process against FakeDiscord: the guild arrives with its first 250 members, the full mode
+# then downloads the rest in member chunks as discord.py does at startup, and both modes finish by handling a burst of
+# reaction role removals from members the bot has never seen. Reports startup time, resident memory and API calls.
+#
+#     python benchmarks/member_cache_benchmark.py [--members 100000] [--removals 200]
+#
+# Resident memory is read from /proc, so the memory columns are only filled in on Linux.
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from fake_discord import FakeDiscord, RateLimit  # noqa: E402
+
+GUILD_CREATE_MEMBER_LIMIT = 250
+REACTION_EMOJI = '🔴'
+
+
+def resident_memory():
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def wait_until(condition, timeout=300, interval=0.01):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+# Run one mode in this process and return its measurements.
+def measure(mode, member_count, removal_count, seed):
+    random.seed(seed)
+    fake = FakeDiscord(latency=0.02, jitter=0.01, gateway_latency=0.001, rate_limit=RateLimit(50, 1.0))
+    guild = fake.make_guild("Large Guild", role_count=50, member_count=member_count, channel_count=10)
+    guild_id = int(guild["id"])
+    channel_id = int(guild["channels"][0]["id"])
+    message_id = fake.next_id()
+    role_id = guild["roles"][1]["id"]
+
+    # Members who'll take the role back off; they all hold it and, past the first chunk, aren't in GUILD_CREATE.
+    removers = random.sample(guild["members"][GUILD_CREATE_MEMBER_LIMIT:], removal_count)
+    for member in removers:
+        if role_id not in member["roles"]:
+            member["roles"].append(role_id)
+
+    work_dir = tempfile.mkdtemp(prefix="goose_bot_members_")
+    with open(os.path.join(work_dir, "reaction_roles.json"), "w", encoding="utf-8") as config_file:
+        json.dump({str(message_id): {REACTION_EMOJI: int(role_id)}}, config_file)
+    os.chdir(work_dir)
+    os.environ.update({
+        "BOT_TOKEN": "fake-token",
+        "SUB_CHANNEL_ID": str(channel_id),
+        "DAILY_MESSAGE_CHANNEL_ID": str(channel_id),
+        "REACTION_ROLE_CONFIG": os.path.join(work_dir, "reaction_roles.json"),
+        "ROLE_BATCH_WINDOW": "0.05",
+        "ROLE_BATCH_MAX_DELAY": "0.5",
+        "LAZY_MEMBERS": "1" if mode == "lazy" else "0",
+    })
+    import goose_bot
+
+    loop = goose_bot.goose_bot.loop
+    gc.collect()
+    memory_before = resident_memory()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+
+    async def start_up():
+        fake.install(goose_bot.goose_bot, [guild], guild_create_member_limit=GUILD_CREATE_MEMBER_LIMIT)
+        if not goose_bot.LAZY_MEMBERS:
+            await fake.chunk_guild(guild_id)
+
+    loop.run_until_complete(start_up())
+    startup_seconds = time.perf_counter() - started
+    startup_cpu_seconds = time.process_time() - cpu_started
+    gc.collect()
+    memory_after = resident_memory()
+    cached_members = len(goose_bot.goose_bot.get_guild(guild_id).members)
+
+    goose_bot.set_up_scheduled_messages()
+    fake.reset_counters()
+    errors = []
+    loop.set_exception_handler(lambda loop, context: errors.append(repr(context.get("exception"))))
+
+    async def remove_reactions():
+        await wait_until(lambda: goose_bot.reaction_router.watched)
+        removals_started = time.perf_counter()
+        for member in removers:
+            fake.reaction(False, guild_id, channel_id, message_id, int(member["user"]["id"]), REACTION_EMOJI)
+        batcher = goose_bot.role_batcher
+        finished = await wait_until(lambda: len(fake.member_edit_log) >= removal_count and not batcher.pending
+                                    and not batcher.flushing)
+        return time.perf_counter() - removals_started, finished
+
+    removal_seconds, finished = loop.run_until_complete(remove_reactions())
+    problems = []
+    if not finished:
+        problems.append("only %d of %d removals were applied" % (len(fake.member_edit_log), removal_count))
+    if any(role_id in member["roles"] for member in removers):
+        problems.append("some members kept the role")
+    # The fake server applying an edit doesn't mean the bot saw it succeed.
+    if goose_bot.role_batcher.counters["member_edits"] < removal_count:
+        problems.append("the bot saw only %d of %d removals succeed"
+                        % (goose_bot.role_batcher.counters["member_edits"], removal_count))
+    if errors:
+        problems.append("%d unhandled errors, e.g. %s" % (len(errors), errors[0]))
+
+    return {
+        "mode": mode,
+        "members": member_count,
+        "startup_seconds": startup_seconds,
+        "startup_cpu_seconds": startup_cpu_seconds,
+        "rss_before": memory_before,
+        "rss_after": memory_after,
+        "rss_growth": memory_after - memory_before if memory_before is not None else None,
+        "cached_members": cached_members,
+        "removals": removal_count,
+        "removal_seconds": removal_seconds,
+        "member_fetches": fake.requests[("GET", "get_member")],
+        "member_edits": len(fake.member_edit_log),
+        "problems": problems,
+    }
+
+
+def megabytes(size):
+    return "n/a" if size is None else "%.1f MB" % (size / 1024 / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare goose_bot's full and lazy member cache modes.")
+    parser.add_argument("--members", type=int, default=100000, help="Members in the synthetic guild.")
+    parser.add_argument("--removals", type=int, default=200,
+                        help="Reaction role removals from members outside the first chunk.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=("full", "lazy"), help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Also write the results to this file as JSON.")
+    arguments = parser.parse_args()
+    arguments.removals = min(arguments.removals, max(0, arguments.members - GUILD_CREATE_MEMBER_LIMIT))
+
+    if arguments.mode:
+        print(json.dumps(measure(arguments.mode, arguments.members, arguments.removals, arguments.seed)))
+        return
+
+    # Each mode gets a fresh process, so neither inherits the other's memory or imported bot.
+    results = []
+    for mode in ("full", "lazy"):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode,
+                                 "--members", str(arguments.members), "--removals", str(arguments.removals),
+                                 "--seed", str(arguments.seed)], stdout=subprocess.PIPE, check=True)
+        results.append(json.loads(output.stdout.decode().strip().splitlines()[-1]))
+
+    print("%-6s %10s %10s %12s %12s %10s %12s %10s"
+          % ("mode", "startup", "cpu", "rss growth", "rss total", "cached", "removals", "fetches"))
+    for result in results:
+        print("%-6s %9.2fs %9.2fs %12s %12s %10d %11.2fs %10d"
+              % (result["mode"], result["startup_seconds"], result["startup_cpu_seconds"],
+                 megabytes(result["rss_growth"]), megabytes(result["rss_after"]), result["cached_members"],
+                 result["removal_seconds"], result["member_fetches"]))
+
+    problems = [result["mode"] + ": " + problem for result in results for problem in result["problems"]]
+    for problem in problems:
+        print("PROBLEM " + problem)
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as json_file:
+            json.dump(results, json_file, indent=2)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# Offline load tests for goose_bot.
+# Runs the bot's real handlers against FakeDiscord, an in-process stand-in for the gateway and REST API with
+# simulated latency and rate limits, and reports throughput, p50/p99 latency, event loop lag and API calls per
+# operation for each scripted workload. Needs discord.py and python-dotenv, but no network or bot token.
+#
+#     python benchmarks/run_benchmarks.py [--scale 0.5] [--latency 0.02] [--json results.json]
+#
+# Exits with a non-zero status if a workload leaves the fake server in the wrong state.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from fake_discord import FakeDiscord, RateLimit  # noqa: E402
+
+REACTION_EMOJI = ['🔴', '🟡', '🟢', '🔵', '🟣', '🟠', '⚫', '⚪', '🟤', '🔶']
+ROLL_EXPRESSIONS = ['2d6', '4d6kh3+2d8-1', 'd%', '100d20', '50000d6', '1000000d6']
+TIP_WORDS = ['raid', 'weather', 'shiny', 'candy', 'stardust', 'lucky', 'egg', 'trade', 'gym', 'berry', 'league',
+             'shadow', 'Pokémon', 'incense', 'lure', 'buddy', 'friend', 'research', 'rocket', 'evolve']
+TIP_QUERIES = ['', 'raid weather', 'shiny pokemon', 'lucky trades', 'berries gym', 'no such words']
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Result:
+    def __init__(self, name, operations, seconds, latencies, fake, loop_lag, problems):
+        self.name = name
+        self.operations = operations
+        self.seconds = seconds
+        self.latencies = latencies
+        self.api_calls = sum(fake.requests.values())
+        self.api_calls_by_route = dict(Counter({route: n for (method, route), n in fake.requests.items()}))
+        self.rate_limited = fake.rate_limited
+        self.loop_lag_p99 = loop_lag.percentile(99)
+        self.loop_lag_max = loop_lag.maximum
+        self.problems = problems
+
+    def as_dict(self):
+        return {
+            "workload": self.name,
+            "operations": self.operations,
+            "seconds": self.seconds,
+            "throughput": self.operations / self.seconds if self.seconds else 0.0,
+            "latency_p50": percentile(self.latencies, 50),
+            "latency_p99": percentile(self.latencies, 99),
+            "loop_lag_p99": self.loop_lag_p99,
+            "loop_lag_max": self.loop_lag_max,
+            "api_calls": self.api_calls,
+            "api_calls_per_operation": self.api_calls / self.operations if self.operations else 0.0,
+            "api_calls_by_route": self.api_calls_by_route,
+            "rate_limited": self.rate_limited,
+            "problems": self.problems,
+        }
+
+
+async def wait_until(condition, timeout=120, interval=0.01):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+class Benchmarks:
+    def __init__(self, goose_bot, fake, guild, work_dir, scale):
+        self.goose_bot = goose_bot
+        self.fake = fake
+        self.guild = guild
+        self.guild_id = int(guild["id"])
+        self.work_dir = work_dir
+        self.scale = scale
+        self.members = [int(m["user"]["id"]) for m in guild["members"] if not m["user"].get("bot")]
+        self.free_channels = [int(c["id"]) for c in guild["channels"][2:]]
+        self.errors = []  # Exceptions no handler caught, reported by the event loop.
+
+    def record_error(self, loop, context):
+        self.errors.append(context.get("message", "") + ": " + repr(context.get("exception")))
+
+    def scaled(self, count):
+        return max(1, int(count * self.scale))
+
+    def start(self):
+        self.fake.reset_counters()
+        self.goose_bot.telemetry.loop_lag = type(self.goose_bot.telemetry.loop_lag)()
+        self.errors.clear()
+        return time.perf_counter()
+
+    def finish(self, name, operations, started, latencies, problems):
+        seconds = time.perf_counter() - started
+        if self.errors:
+            problems.append(str(len(self.errors)) + " unhandled errors, e.g. " + self.errors[0])
+        return Result(name, operations, seconds, latencies, self.fake, self.goose_bot.telemetry.loop_lag, problems)
+
+    async def settle(self):
+        return await wait_until(lambda: self.fake.in_flight == 0 and not self.goose_bot.outbox.pending())
+
+    # Texts delivered so far; the outbox may have joined several into one message, a line each.
+    def texts_sent(self):
+        return sum(content.count("\n") + 1 for _, _, content in self.fake.message_log)
+
+    # Members click through the subscription message, some changing their minds, all at once.
+    async def reaction_storm(self, message_id, channel_id, emoji_roles):
+        batcher = self.goose_bot.role_batcher
+        counters_before = dict(batcher.counters)
+        members = random.sample(self.members, min(self.scaled(200), len(self.members)))
+        expected = {}
+        last_event = {}
+        events = 0
+        started = self.start()
+        for member_id in members:
+            roles = set(self.fake.guilds[self.guild_id]["members"][member_id]["roles"])
+            for emoji in random.sample(REACTION_EMOJI, 4):
+                self.fake.reaction(True, self.guild_id, channel_id, message_id, member_id, emoji)
+                roles.add(emoji_roles[emoji])
+                events += 1
+                if random.random() < 0.25:
+                    self.fake.reaction(False, self.guild_id, channel_id, message_id, member_id, emoji)
+                    roles.discard(emoji_roles[emoji])
+                    events += 1
+            expected[member_id] = roles
+            last_event[member_id] = time.perf_counter()
+            if events % 50 < 5:
+                await asyncio.sleep(0)
+
+        problems = []
+        if not await wait_until(lambda: not batcher.pending and not batcher.flushing and self.fake.in_flight == 0
+                                and not self.goose_bot.outbox.pending()):
+            problems.append("reaction storm did not finish")
+        first_edit = {}
+        for edited_at, guild_id, member_id in self.fake.member_edit_log:
+            if member_id in last_event and member_id not in first_edit and edited_at >= last_event[member_id]:
+                first_edit[member_id] = edited_at
+        latencies = [first_edit[m] - last_event[m] for m in first_edit]
+        wrong = [m for m in members if set(self.fake.guilds[self.guild_id]["members"][m]["roles"]) != expected[m]]
+        if wrong:
+            problems.append(str(len(wrong)) + " members ended up with the wrong roles")
+
+        # The fake server applying an edit doesn't mean the bot saw it succeed, so check the bot's side too.
+        edits = batcher.counters["member_edits"] - counters_before["member_edits"]
+        failed_edits = batcher.counters["failed_edits"] - counters_before["failed_edits"]
+        if failed_edits:
+            problems.append(str(failed_edits) + " role edits failed")
+        if edits < len(self.fake.member_edit_log):
+            problems.append(str(len(self.fake.member_edit_log) - edits) + " role edits went through but raised")
+        confirmations = sum(content.count("\n") + 1 for _, sent_to, content in self.fake.message_log
+                            if sent_to == channel_id)
+        if confirmations < edits:
+            problems.append(str(edits - confirmations) + " role edits were never confirmed")
+        return self.finish("reaction storm", events, started, latencies, problems)
+
+    # Many members run a command at once, each in their own channel so replies can be told apart.
+    async def command_burst(self, name, commands):
+        channels = self.free_channels[:len(commands)]
+        sent_at = {}
+        started = self.start()
+        for channel_id, content in zip(channels, commands):
+            sent_at[channel_id] = time.perf_counter()
+            self.fake.user_message(self.guild_id, channel_id, random.choice(self.members), content)
+
+        def replied():
+            return {channel_id for _, channel_id, _ in self.fake.message_log} >= set(channels)
+
+        problems = []
+        if not await wait_until(replied):
+            problems.append(name + " did not get a reply to every command")
+        await self.settle()
+        first_reply = {}
+        for replied_at, channel_id, content in self.fake.message_log:
+            first_reply.setdefault(channel_id, replied_at)
+        latencies = [first_reply[c] - sent_at[c] for c in channels if c in first_reply]
+        return self.finish(name, len(commands), started, latencies, problems)
+
+    async def roll_burst(self):
+        count = min(self.scaled(200), len(self.free_channels))
+        return await self.command_burst(".roll burst", [".roll " + random.choice(ROLL_EXPRESSIONS)
+                                                         for _ in range(count)])
+
+    async def tip_burst(self):
+        count = min(self.scaled(200), len(self.free_channels))
+        return await self.command_burst(".tip burst", [(".tip " + random.choice(TIP_QUERIES)).strip()
+                                                        for _ in range(count)])
+
+    async def roles_burst(self):
+        count = min(self.scaled(200), len(self.free_channels))
+        return await self.command_burst(".roles burst", [".roles"] * count)
+
+    # Moderators each add, remove and toggle roles for a group of members with one .role command.
+    async def role_burst(self, members_per_command=10):
+        count = min(self.scaled(50), len(self.free_channels), len(self.members) // members_per_command)
+        member_roles = self.fake.guilds[self.guild_id]["members"]
+        members = random.sample(self.members, count * members_per_command)
+        commands = []
+        expected = {}
+        for number in range(count):
+            group = members[number * members_per_command:(number + 1) * members_per_command]
+            add, remove, toggle = random.sample(self.guild["roles"][1:-1], 3)
+            commands.append(".role +" + add["name"] + " -" + remove["name"] + " " + toggle["name"] + " "
+                            + " ".join("<@" + str(member_id) + ">" for member_id in group))
+            for member_id in group:
+                roles = (set(member_roles[member_id]["roles"]) | {add["id"]}) - {remove["id"]}
+                expected[member_id] = roles ^ {toggle["id"]}
+        result = await self.command_burst(".role burst (" + str(members_per_command) + " members each)", commands)
+        wrong = [m for m in members if set(member_roles[m]["roles"]) != expected[m]]
+        if wrong:
+            result.problems.append(str(len(wrong)) + " members ended up with the wrong roles")
+        return result
+
+    # A day of per-channel scheduled messages on a fast-forwarded clock, then a restart that must not resend.
+    async def scheduler_day(self):
+        from goose_bot_scheduler import Scheduler
+
+        now = [datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()]
+        history_file = os.path.join(self.work_dir, "benchmark_scheduler.json")
+        channels = self.free_channels[:self.scaled(300)]
+
+        def register_jobs():
+            self.goose_bot.scheduler = Scheduler(history_file, clock=lambda: now[0])
+            for channel_id in channels:
+                self.goose_bot.schedule_message("every-6-hours-" + str(channel_id), channel_id, "Reminder!",
+                                                cron="0 */6 * * *")
+            self.goose_bot.schedule_message("daily-" + str(channels[0]), channels[0], "Daily tip!",
+                                            cron="0 19 * * *")
+            return self.goose_bot.scheduler
+
+        scheduler = register_jobs()
+        expected = len(channels) * 4 + 1
+        wake_costs = []
+        started = self.start()
+        for _ in range(24 * 60):
+            now[0] += 60
+            wake_started = time.perf_counter()
+            scheduler.fire_due_jobs()
+            wake_costs.append(time.perf_counter() - wake_started)
+            await asyncio.sleep(0)
+        problems = []
+        if not await wait_until(lambda: self.texts_sent() >= expected):
+            problems.append("scheduler sent " + str(self.texts_sent()) + " of " + str(expected) + " messages")
+        await self.settle()
+        sent = self.texts_sent()
+        if sent > expected:
+            problems.append("scheduler sent " + str(sent - expected) + " messages too many")
+
+        # Restarting from the saved history must neither resend nor skip anything.
+        scheduler = register_jobs()
+        scheduler.fire_due_jobs()
+        await asyncio.sleep(0.1)
+        await self.settle()
+        if self.texts_sent() != sent:
+            problems.append("scheduler resent " + str(self.texts_sent() - sent) + " messages on restart")
+        return self.finish("scheduler (1 simulated day)", sent, started, wake_costs, problems)
+
+
+def print_table(results):
+    header = "%-28s %7s %8s %9s %9s %9s %9s %9s %8s %5s" % (
+        "workload", "ops", "seconds", "ops/s", "p50 ms", "p99 ms", "lag p99", "lag max", "API/op", "429s")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        row = result.as_dict()
+        print("%-28s %7d %8.2f %9.1f %9.2f %9.2f %9.2f %9.2f %8.2f %5d" % (
+            row["workload"], row["operations"], row["seconds"], row["throughput"], row["latency_p50"] * 1000,
+            row["latency_p99"] * 1000, row["loop_lag_p99"] * 1000, row["loop_lag_max"] * 1000,
+            row["api_calls_per_operation"], row["rate_limited"]))
+        for problem in row["problems"]:
+            print("    PROBLEM: " + problem)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load tests for goose_bot.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every workload's size by this.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated REST latency in seconds.")
+    parser.add_argument("--rate-limit", type=int, default=50, help="Requests allowed per bucket per second.")
+    parser.add_argument("--member-edit-limit", type=int, default=10,
+                        help="Member edits allowed per guild per second, shared across routes.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the results to this file as JSON.")
+    arguments = parser.parse_args()
+    random.seed(arguments.seed)
+
+    # Discord shares one member-edit bucket per guild across several routes, which discord.py can't predict.
+    member_routes = r"/guilds/(\d+)/members/\d+(/roles/\d+)?"
+    fake = FakeDiscord(latency=arguments.latency, jitter=arguments.latency / 2,
+                       rate_limit=RateLimit(arguments.rate_limit, 1.0),
+                       route_rate_limits={
+                           ("PATCH", member_routes): (RateLimit(arguments.member_edit_limit, 1.0), lambda m: m[1]),
+                           ("PUT", member_routes): (RateLimit(arguments.member_edit_limit, 1.0), lambda m: m[1]),
+                           ("DELETE", member_routes): (RateLimit(arguments.member_edit_limit, 1.0), lambda m: m[1]),
+                       })
+    scale = arguments.scale
+    guild = fake.make_guild("Benchmark Guild", role_count=300, member_count=max(10, int(1000 * scale)),
+                            channel_count=max(10, int(310 * scale)))
+    sub_channel_id = int(guild["channels"][0]["id"])
+    daily_channel_id = int(guild["channels"][1]["id"])
+    sub_message_id = fake.next_id()
+    emoji_roles = {emoji: role["id"] for emoji, role in zip(REACTION_EMOJI, guild["roles"][1:])}
+
+    json_file_name = os.path.abspath(arguments.json) if arguments.json else None
+    work_dir = tempfile.mkdtemp(prefix="goose_bot_bench_")
+    with open(os.path.join(work_dir, "reaction_roles.json"), "w", encoding="utf-8") as config_file:
+        json.dump({str(sub_message_id): {emoji: int(role_id) for emoji, role_id in emoji_roles.items()}}, config_file)
+    with open(os.path.join(work_dir, "tips.txt"), "w", encoding="utf-8") as tips_file:
+        for number in range(max(100, int(5000 * scale))):
+            tips_file.write(" ".join(random.choice(TIP_WORDS) for _ in range(15)) + " (tip " + str(number) + ")\n")
+    os.chdir(work_dir)
+    os.environ.update({
+        "BOT_TOKEN": "fake-token",
+        "SUB_CHANNEL_ID": str(sub_channel_id),
+        "DAILY_MESSAGE_CHANNEL_ID": str(daily_channel_id),
+        "REACTION_ROLE_CONFIG": os.path.join(work_dir, "reaction_roles.json"),
+        "TIPS_FILE": os.path.join(work_dir, "tips.txt"),
+        "ROLE_BATCH_WINDOW": "0.05",
+        "ROLE_BATCH_MAX_DELAY": "0.5",
+    })
+    import goose_bot
+
+    goose_bot.CONFIRMATION_LIFETIME = 0.5
+    loop = goose_bot.goose_bot.loop
+    fake.install(goose_bot.goose_bot, [guild])
+    goose_bot.set_up_scheduled_messages()
+    benchmarks = Benchmarks(goose_bot, fake, guild, work_dir, scale)
+    loop.set_exception_handler(benchmarks.record_error)
+
+    async def run_all():
+        await wait_until(lambda: goose_bot.reaction_router.watched)
+        return [
+            await benchmarks.reaction_storm(sub_message_id, sub_channel_id, emoji_roles),
+            await benchmarks.roll_burst(),
+            await benchmarks.tip_burst(),
+            await benchmarks.roles_burst(),
+            await benchmarks.role_burst(),
+            await benchmarks.scheduler_day(),
+        ]
+
+    results = loop.run_until_complete(run_all())
+    for task in asyncio.all_tasks(loop):
+        task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+
+    print_table(results)
+    if json_file_name:
+        with open(json_file_name, "w") as json_file:
+            json.dump([r.as_dict() for r in results], json_file, indent=2)
+    sys.exit(1 if any(r.problems for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,14 +12,29 @@ from dotenv import load_dotenv
 
 # Import utils for the bot
 import goose_bot_utils
-import extended_emoji_dict
-
-# Import sleep for some delays
-from time import sleep
-
-# Import datetime for upkeep messages
-from datetime import datetime, time, timedelta
-import asyncio
+import goose_bot_dice
+import goose_bot_role_edits
+from goose_bot_janitor import MessageJanitor
+from goose_bot_role_batcher import RoleChangeBatcher
+from goose_bot_reaction_router import ReactionRoleRouter, compile_emoji_dict
+from goose_bot_scheduler import Scheduler
+from goose_bot_role_index import RoleIndexCache
+from goose_bot_logging import set_up_logging
+from goose_bot_stats import Telemetry
+from goose_bot_members import MemberCache
+from goose_bot_member_roles import MemberRoleEdits
+from goose_bot_tips import TipEngine
+from goose_bot_outbox import Outbox, HIGH, NORMAL, LOW
+
+# The emoji -> role dict is optional once the reaction roles are set up in REACTION_ROLE_CONFIG.
+try:
+    import extended_emoji_dict
+except ImportError:
+    extended_emoji_dict = None
+
+# Import datetime and json for upkeep messages
+from datetime import time
+import json
 
 # Miscellaneous imports
 from math import floor
@@ -35,11 +50,30 @@ GOOSE_BOT_DESCRIPTION = "A bot for basic server utilities."
 REACTION_ROLE_MESSAGE_ID = os.getenv('REACTION_ROLE_MESSAGE_ID')
 NOTIF_SUB_MESSAGE_ID = os.getenv('NOTIF_SUB_MESSAGE_ID')
 SUB_CHANNEL_ID = os.getenv('SUB_CHANNEL_ID')
+REACTION_ROLE_CONFIG = os.getenv('REACTION_ROLE_CONFIG', 'reaction_roles.json')
 DAILY_MESSAGE_TIME = time(19, 0, 0)  # 12PM PST
 DAILY_MESSAGE_CHANNEL_ID = int(os.getenv('DAILY_MESSAGE_CHANNEL_ID'))
 HOURLY_MESSAGE_CHANNEL_ID = DAILY_MESSAGE_CHANNEL_ID
-DAILY_MESSAGE = "Goose bot lives another day!"
+DAILY_MESSAGE = "Goose bot lives another day!"  # Posted instead of a tip if there are none.
+TIPS_FILE = os.getenv('TIPS_FILE', 'tips.txt')
+TIP_ROTATION_FILE_NAME = "goose_bot_tips.json"
+TIP_SEARCH_LIMIT = 3  # Most tips shown for one search.
 HOURLY_MESSAGE = "Goose bot checking in."
+HOURLY_MESSAGE_MISFIRE_GRACE = 300  # A check-in missed during a restart is only worth sending if it's this recent.
+SCHEDULER_FILE_NAME = "goose_bot_scheduler.json"
+SCHEDULED_MESSAGES_CONFIG = os.getenv('SCHEDULED_MESSAGES_CONFIG', 'scheduled_messages.json')
+STATS_FILE_NAME = "goose_bot_stats.prom"
+STATS_PORT = int(os.getenv('STATS_PORT', '0'))  # Serve stats on this local port too, if set.
+CONFIRMATION_LIFETIME = 5  # Seconds before reaction role confirmations are cleaned up.
+JANITOR_FILE_NAME = "goose_bot_janitor.json"
+ROLE_BATCH_WINDOW = float(os.getenv('ROLE_BATCH_WINDOW', '1.5'))  # Seconds of quiet before a member's changes apply.
+ROLE_BATCH_MAX_DELAY = float(os.getenv('ROLE_BATCH_MAX_DELAY', '5'))  # Longest a change waits, however busy.
+ROLE_BATCH_MAX_CHANGES = int(os.getenv('ROLE_BATCH_MAX_CHANGES', '25'))  # Pending roles that force an early flush.
+# In lazy member mode, members aren't downloaded at startup but looked up when needed and kept in a small cache.
+LAZY_MEMBERS = os.getenv('LAZY_MEMBERS', '0') == '1'
+MEMBER_CACHE_SIZE = int(os.getenv('MEMBER_CACHE_SIZE', '5000'))
+MEMBER_CACHE_TTL = float(os.getenv('MEMBER_CACHE_TTL', '300'))  # Seconds before a cached member is looked up again.
+ROLE_EDIT_CONCURRENCY = int(os.getenv('ROLE_EDIT_CONCURRENCY', '4'))  # Members .role edits at the same time.
 
 # Set up required intents
 intents = discord.Intents.default()
@@ -50,28 +84,75 @@ intents.members = True
 # Set up the logger
 
 LOG_FILE_NAME = "goose_bot_logs.log"
-LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-logging.basicConfig(filename=LOG_FILE_NAME, format=LOG_FORMAT, level=logging.INFO)
+set_up_logging(LOG_FILE_NAME, json_format=os.getenv('LOG_FORMAT_STYLE', 'text') == 'json',
+               max_bytes=int(os.getenv('LOG_MAX_BYTES', 5 * 1024 * 1024)),
+               backup_count=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+               interval=int(os.getenv('LOG_ROTATE_INTERVAL', 24 * 60 * 60)))
+reaction_roles_log = logging.getLogger("goose_bot.reaction_roles")
+role_management_log = logging.getLogger("goose_bot.role_management")
+dice_log = logging.getLogger("goose_bot.dice")
+scheduler_log = logging.getLogger("goose_bot.scheduler")
+tips_log = logging.getLogger("goose_bot.tips")
 
 # Initialize the client
 client = discord.Client()
 
 # Initialize the bot
-goose_bot = commands.Bot(command_prefix=GOOSE_BOT_COMMAND_PREFIX, description=GOOSE_BOT_DESCRIPTION, intents=intents)
+if LAZY_MEMBERS:
+    goose_bot = commands.Bot(command_prefix=GOOSE_BOT_COMMAND_PREFIX, description=GOOSE_BOT_DESCRIPTION,
+                             intents=intents, chunk_guilds_at_startup=False,
+                             member_cache_flags=discord.MemberCacheFlags.none())
+else:
+    goose_bot = commands.Bot(command_prefix=GOOSE_BOT_COMMAND_PREFIX, description=GOOSE_BOT_DESCRIPTION,
+                             intents=intents)
 
-# Set the reaction messages and the emoji->role dict.
-# The dict is kept in a private file because of irrelevant personal information, and a default dict is provided below.
-channel_sub_message_id = REACTION_ROLE_MESSAGE_ID
-notif_sub_message_id = NOTIF_SUB_MESSAGE_ID
-emoji_to_role = extended_emoji_dict.emoji_to_role_extended
+# Initialize the cache of members looked up on demand
+member_cache = MemberCache(MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL)
+
+# Initialize the record of role edits Discord hasn't echoed back yet, shared by reaction roles and .role
+member_role_edits = MemberRoleEdits()
+
+# Initialize the telemetry that times commands and events and counts API calls
+telemetry = Telemetry(goose_bot)
+telemetry.install()
+
+# Initialize the outbox that queues, batches and paces every message the bot sends
+outbox = Outbox(goose_bot)
+
+# Initialize the janitor that cleans up temporary messages in the background
+janitor = MessageJanitor(goose_bot, JANITOR_FILE_NAME)
+
+# Initialize the scheduler that runs every recurring job from one task
+scheduler = Scheduler(SCHEDULER_FILE_NAME)
+
+# Initialize the cache of rendered role listings
+role_indexes = RoleIndexCache()
 
+# Initialize the tips, which are read from disk and indexed once the bot is ready
+tips = TipEngine(TIPS_FILE, TIP_ROTATION_FILE_NAME)
 
-# Basic version of the emoji-> role dict, to use if you don't have a more personal one to supply in extended_emoji_dict.
-# emoji_to_role = {
-#     discord.PartialEmoji(name='🔴'): 0, # ID of the role associated with unicode emoji '🔴'.
-#     discord.PartialEmoji(name='🟡'): 0, # ID of the role associated with unicode emoji '🟡'.
-#     discord.PartialEmoji(name='green', id=0): 0, # ID of the role associated with a partial emoji's ID.
+# Set the reaction messages and the emoji->role dict.
+# Reaction roles are read from REACTION_ROLE_CONFIG, a JSON file mapping any number of message IDs to
+# {emoji: role ID}, where an emoji is a unicode emoji or a custom emoji's ID. For example:
+# {
+#     "123456789012345678": {
+#         "🔴": 0, # ID of the role associated with unicode emoji '🔴'.
+#         "🟡": 0, # ID of the role associated with unicode emoji '🟡'.
+#         "0": 0 # ID of the role associated with a custom emoji's ID.
+#     }
 # }
+# Without that file, the two messages from the environment file share the dict kept in extended_emoji_dict,
+# which is kept in a private file because of irrelevant personal information.
+def make_default_reaction_roles():
+    if extended_emoji_dict is None:
+        return {}
+    emoji_to_role = compile_emoji_dict(extended_emoji_dict.emoji_to_role_extended)
+    return {int(message_id): emoji_to_role
+            for message_id in (REACTION_ROLE_MESSAGE_ID, NOTIF_SUB_MESSAGE_ID) if message_id}
+
+
+# Initialize the routing table that maps reactions on the subscription messages to roles
+reaction_router = ReactionRoleRouter(goose_bot, REACTION_ROLE_CONFIG, make_default_reaction_roles())
 
 
 # Log readiness.
@@ -80,217 +161,239 @@ async def on_ready():
     print('Logged in as ' + goose_bot.user.name)
     print(goose_bot.user.id)
     print('------')
+    tips.start_indexing(goose_bot.loop)
+
+
+# Queue a reply to a command. A command's latency in .stats runs until its reply has been sent, not just queued.
+def reply(ctx, text):
+    return telemetry.track_reply(ctx, outbox.send(ctx.channel, text, HIGH))
 
 
 # Roll dice.
 @goose_bot.command()
-async def roll(ctx, dice: str):
-    """Roll dice in NdN format."""
-    logging.info("Dice: Rolling dice...")
+async def roll(ctx, *, dice: str = ""):
+    """Roll dice, e.g. 2d6, d%, 4d6kh3+2d8-1 (kh/kl keep, dh/dl drop)."""
+    dice_log.info("Rolling dice %s...", dice)
     try:
-        rolls, limit = map(int, dice.split('d'))
-    except (Exception,):
-        await ctx.send('Format has to be NdN!')
+        result = await goose_bot_dice.roll(dice)
+    except goose_bot_dice.DiceError as error:
+        reply(ctx, str(error))
         return
-    result = await goose_bot_utils.roll_result(limit, rolls)
 
-    await ctx.send(result)
+    reply(ctx, result)
+
+
+# Show the next tip for the channel, or the tips matching some keywords.
+@goose_bot.command()
+async def tip(ctx, *, query: str = ""):
+    """Show a tip, or search the tips, e.g. .tip raid weather."""
+    if query == "":
+        next_tip = tips.next_tip(ctx.channel.id)
+        reply(ctx, next_tip if next_tip is not None else "I don't have any tips yet.")
+        return
+
+    matches, match_count = await tips.search(query, TIP_SEARCH_LIMIT)
+    tips_log.info("Found %d tips for \"%s\".", match_count, query)
+    if not matches:
+        reply(ctx, "I don't have any tips about that.")
+        return
+    text = "\n\n".join(matches)
+    if match_count > len(matches):
+        text += "\n\n(" + str(match_count - len(matches)) + " more, add words to narrow it down.)"
+    reply(ctx, text[:goose_bot_utils.MESSAGE_LIMIT])
 
 
 # List the roles of the server and the command author.
 @goose_bot.command()
 async def roles(ctx):
     """List available and currently assigned roles."""
-    server_roles = ctx.author.guild.roles
-    prettified_member_roles = await goose_bot_utils.prettify_roles(ctx.author.roles, "Your roles:")
-    prettified_server_roles = await goose_bot_utils.prettify_roles(server_roles, "All roles:")
-    logging.info("Role Management: Printing roles for server " + ctx.author.guild.name + ".")
-    await ctx.send(prettified_server_roles)
-    await ctx.send(prettified_member_roles)
+    role_index = role_indexes.get(ctx.author.guild)
+    role_management_log.info("Printing roles for server %s.", ctx.author.guild.name)
+    pages = role_index.member_pages(ctx.author, "Your roles:") + role_index.pages
+    telemetry.track_reply(ctx, goose_bot_utils.send_pages(ctx, outbox, goose_bot_utils.merge_pages(pages), HIGH))
 
 
-# Add the desired role to the command author or a specific user.
+# Show performance statistics to server administrators.
 @goose_bot.command()
-async def role(ctx, role_name: discord.Role = "", user_name: discord.Member = "author"):
-    """Add/remove a role by its name."""
-    if role_name == "":
-        await ctx.send("Specify a role to add or remove.")
-    else:
-        try:
-            if user_name == "author":
-                logging.info("Role Management: Managing role " + role_name.name 
-                             + " for " + ctx.author.display_name + ".")
-                if role_name in ctx.author.roles:
-                    await ctx.author.remove_roles(role_name)
-                    await ctx.send("Relieved you of the role `" + role_name.name + "`.")
-                else:
-                    await ctx.author.add_roles(role_name)
-                    await ctx.send("Granted you the role `" + role_name.name + "`.")
-            else:
-                logging.info("Role Management: Managing role " + role_name.name
-                             + " for " + user_name.display_name + ".")
-                if role_name in user_name.roles:
-                    await user_name.remove_roles(role_name)
-                    await ctx.send("Removed `" + role_name.name + "` from " + user_name.display_name + ".")
-                else:
-                    await user_name.add_roles(role_name)
-                    await ctx.send("Granted `" + role_name.name + "` to " + user_name.display_name + ".")
-        except (Exception,):
-            await ctx.send("Something went wrong assigning roles, sorry!")
+@commands.has_permissions(administrator=True)
+async def stats(ctx):
+    """Show latency, event loop lag and API usage statistics."""
+    reply(ctx, "```\n" + telemetry.summary()[:1990] + "\n```")
 
 
-# Add a role associated with an appropriate reaction on an appropriate message.
-@goose_bot.event
-async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
-    if (payload.message_id != int(channel_sub_message_id)) and (payload.message_id != int(notif_sub_message_id)):
+# Add or remove roles for the command author or any number of members.
+@goose_bot.command()
+@commands.guild_only()
+async def role(ctx, *arguments: str):
+    """Add/remove roles, e.g. .role raids, .role +raids -pvp @member1 @member2."""
+    try:
+        changes, members = await goose_bot_role_edits.parse_role_arguments(ctx, arguments)
+    except goose_bot_role_edits.RoleArgumentError as error:
+        reply(ctx, str(error))
         return
-
-    guild = goose_bot.get_guild(payload.guild_id)
-    logging.info("Reaction Roles: Reaction added to a subscription message in " + guild.name + "!")
-    if guild is None:
+    if not changes:
+        reply(ctx, "Specify a role to add or remove.")
         return
 
-    try:
-        role_id = await get_role_id_from_emoji(payload.emoji)
-    except KeyError:
-        logging.info("Reaction Roles: I don't know what role to grant for that emoji.")
+    members = members or [ctx.author]
+    role_management_log.info("Managing %d roles for %d members.", len(changes), len(members))
+    results = await goose_bot_role_edits.apply_role_changes(members, changes, ROLE_EDIT_CONCURRENCY,
+                                                            member_role_edits)
+    reply(ctx, goose_bot_role_edits.summarise_role_changes(ctx.author, results, goose_bot_utils.MESSAGE_LIMIT))
+
+
+# Add a role associated with an appropriate reaction on an appropriate message.
+@goose_bot.event
+@telemetry.timed_event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    if payload.message_id not in reaction_router.watched:
         return
 
-    emoji_role = guild.get_role(role_id)
+    emoji_role = reaction_router.route(payload)
     if emoji_role is None:
+        reaction_roles_log.info("I don't know what role to grant for %s.", payload.emoji)
         return
+    reaction_roles_log.info("Reaction added to a subscription message in %s!", emoji_role.guild.name)
 
-    try:
-        await payload.member.add_roles(emoji_role)
-        logging.info("Reaction Roles: Adding role " + str(emoji_role) + " to " + payload.member.display_name + "!")
-        message = await goose_bot.get_channel(
-            int(SUB_CHANNEL_ID)).send("Added role `" + str(emoji_role) + "` to " + payload.member.display_name + ".")
-        sleep(5)
-        await message.delete()
-    except discord.HTTPException:
-        pass
+    role_batcher.queue(emoji_role.guild, payload.user_id, emoji_role, True, payload.member)
 
 
 # Remove a role associated with an appropriate reaction on an appropriate message.
 @goose_bot.event
+@telemetry.timed_event
 async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
-    if (payload.message_id != int(channel_sub_message_id)) and (payload.message_id != int(notif_sub_message_id)):
+    if payload.message_id not in reaction_router.watched:
         return
 
-    guild = goose_bot.get_guild(payload.guild_id)
-    logging.info("Reaction Roles: Reaction removed from a subscription message in " + guild.name + "!")
-    if guild is None:
+    emoji_role = reaction_router.route(payload)
+    if emoji_role is None:
+        reaction_roles_log.info("I don't know what role to remove for %s.", payload.emoji)
         return
+    reaction_roles_log.info("Reaction removed from a subscription message in %s!", emoji_role.guild.name)
 
-    try:
-        role_id = await get_role_id_from_emoji(payload.emoji)
-    except KeyError:
-        logging.info("Reaction Roles: I don't know what role to remove for that emoji.")
-        return
+    role_batcher.queue(emoji_role.guild, payload.user_id, emoji_role, False)
 
-    emoji_role = guild.get_role(role_id)
-    if emoji_role is None:
-        return
 
-    member = guild.get_member(payload.user_id)
-    if member is None:
-        return
+# Find the member behind a batch of reaction role changes.
+async def get_reaction_member(guild, member_id, member=None):
+    return await member_cache.resolve(guild, member_id, member)
 
-    try:
-        await member.remove_roles(emoji_role)
-        logging.info("Reaction Roles: Removing role " + str(emoji_role) + " from " + member.display_name + "!")
-        message = await goose_bot.get_channel(
-            int(SUB_CHANNEL_ID)).send("Removed role `" + str(emoji_role) + "` from " + member.display_name + ".")
-        sleep(5)
-        await message.delete()
-    except discord.HTTPException:
-        pass
-
-
-# Refer to the emoji -> role dict in different ways depending on whether a default or custom emoji was provided.
-async def get_role_id_from_emoji(emoji):
-    if emoji.id is None:
-        role_id = emoji_to_role[emoji]
+
+# Queue a single confirmation for a member's batch of reaction role changes, to be cleaned up once it's sent.
+async def confirm_reaction_roles(member, added, removed):
+    def clean_up(future):
+        if future.result() is not None:
+            janitor.schedule(future.result(), CONFIRMATION_LIFETIME)
+
+    # Confirmations only share messages with each other, since the janitor deletes them.
+    confirmation = outbox.send(int(SUB_CHANNEL_ID),
+                               goose_bot_role_edits.describe_role_changes(member.display_name, added, removed),
+                               coalesce="confirmations")
+    confirmation.add_done_callback(clean_up)
+    reaction_roles_log.debug("%d API calls saved by batching so far.", role_batcher.api_calls_saved())
+    return True
+
+
+# Initialize the batcher that turns bursts of reactions into one role edit per member
+role_batcher = RoleChangeBatcher(get_reaction_member, confirm_reaction_roles, member_role_edits,
+                                 window=ROLE_BATCH_WINDOW, max_delay=ROLE_BATCH_MAX_DELAY,
+                                 max_changes=ROLE_BATCH_MAX_CHANGES)
+
+
+# Rebuild the reaction role routing table and role listings when the guild's roles change.
+@goose_bot.event
+@telemetry.timed_event
+async def on_guild_role_create(new_role):
+    role_indexes.invalidate(new_role.guild.id)
+    reaction_router.request_rebuild()
+
+
+@goose_bot.event
+@telemetry.timed_event
+async def on_guild_role_update(old_role, new_role):
+    role_indexes.invalidate(new_role.guild.id)
+    reaction_router.request_rebuild()
+
+
+@goose_bot.event
+@telemetry.timed_event
+async def on_guild_role_delete(old_role):
+    role_indexes.invalidate(old_role.guild.id)
+    reaction_router.request_rebuild()
+
+
+# Send an arbitrary message in an arbitrary channel. Used by scheduled messages.
+# Returns the outbox's future for the message rather than waiting for it to be sent.
+def send_message_in_channel(channel_id, message_str, priority=NORMAL):
+    scheduler_log.info("Queueing message \"%s\" for channel %s", message_str, channel_id)
+    return outbox.send(channel_id, message_str, priority)
+
+
+# Schedule a message to be sent in a channel, either on a cron expression (in UTC) or every interval seconds.
+def schedule_message(name, channel_id, message_str, cron=None, interval=None, misfire_grace=None, priority=NORMAL):
+    async def send():
+        send_message_in_channel(channel_id, message_str, priority)
+
+    if cron is not None:
+        return scheduler.add_cron_job(name, cron, send, misfire_grace)
+    return scheduler.add_interval_job(name, interval, send, misfire_grace)
+
+
+# Post the next tip in the daily message channel's rotation.
+async def send_daily_tip():
+    daily_tip = tips.next_tip(DAILY_MESSAGE_CHANNEL_ID)
+    if daily_tip is None:
+        send_message_in_channel(DAILY_MESSAGE_CHANNEL_ID, DAILY_MESSAGE)
     else:
-        role_id = emoji_to_role[emoji.id]
-    return role_id
-
-
-# Send an arbitrary message in an arbitrary channel. Used by daily_message and hourly_message.
-async def send_message_in_channel(channel_id, message_str):
-    await goose_bot.wait_until_ready()
-    channel = goose_bot.get_channel(channel_id)
-    logging.info("Sending message \"" + message_str + "\" to channel '#" + channel.name + "'")
-    await channel.send(message_str)
-
-
-# Send a message every day at the defined DAILY_MESSAGE_TIME.
-async def daily_message(channel_id, message_str):
-    now = datetime.utcnow()
-    logging.info("Daily Message: It is now " + str(now) + ".")
-    if now.time() > DAILY_MESSAGE_TIME:
-        logging.info("Daily Message: The daily message time was " + str(DAILY_MESSAGE_TIME)
-                     + " but it is already " + str(now) + ".")
-        logging.info("Daily Message: We should wait until tomorrow to send a daily message.")
-        tomorrow = datetime.combine(now.date() + timedelta(days=1), time(0))
-        logging.info("Daily Message: Tomorrow is " + str(tomorrow) + ".")
-        seconds = (tomorrow - now).total_seconds()
-        time_str = await goose_bot_utils.make_time_str(seconds)
-        logging.info("Daily Message: It will be tomorrow in " + time_str + ".")
-        logging.info("Daily Message: Waiting for " + time_str + " (" + str(seconds) + ") seconds...")
-        await asyncio.sleep(seconds)
-    while True:
-        now = datetime.utcnow()
-        logging.info("Daily Message: It is now " + str(now) + ".")
-        target_time = datetime.combine(now.date(), DAILY_MESSAGE_TIME)
-        logging.info("Daily Message: A message should be sent at " + str(target_time) + ".")
-        seconds_until_target = (target_time - now).total_seconds()
-        time_str = await goose_bot_utils.make_time_str(seconds_until_target)
-        logging.info("Daily Message: There are " + time_str + " between now and then.")
-        logging.info("Daily Message: Waiting for " + time_str + " (" + str(seconds_until_target) + ") seconds...")
-        await asyncio.sleep(seconds_until_target)
-        logging.info("Daily Message: Sending daily message!")
-        await send_message_in_channel(channel_id, message_str)
-        logging.info("Daily Message: Daily message sent.")
-        tomorrow = datetime.combine(now.date() + timedelta(days=1), time(0))
-        seconds = (tomorrow - now).total_seconds()
-        time_str = await goose_bot_utils.make_time_str(seconds)
-        logging.info("Daily Message: Tomorrow is " + str(tomorrow) + ", which is in " + time_str + ".")
-        logging.info("Daily Message: Waiting for " + str(seconds) + " seconds...")
-        await asyncio.sleep(seconds)
-
-
-# Send a message on the hour, every hour.
-async def hourly_message(channel_id, message_str):
-    while True:
-        now = datetime.utcnow()
-        logging.info("Hourly Message: It is now " + str(now) + ".")
-        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-        logging.info("Hourly Message: The next clock hour is " + str(next_hour) + ".")
-        seconds_until_next_hour = (next_hour - now).total_seconds()
-        time_str = await goose_bot_utils.make_time_str(seconds_until_next_hour)
-        logging.info("Hourly Message: There are " + time_str + " between now and then.")
-        logging.info("Hourly Message: Waiting for " + time_str + " (" + str(seconds_until_next_hour) + " seconds" + ")...")
-        await asyncio.sleep(seconds_until_next_hour)
-        logging.info("Hourly Message: Sending hourly message!")
-        await send_message_in_channel(channel_id, message_str)
-        logging.info("Hourly Message: Hourly message sent.")
-        in_an_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-        logging.info("Hourly Message: An hour from now is " + str(in_an_hour) + ".")
-        seconds = (in_an_hour - now).total_seconds()
-        time_str = await goose_bot_utils.make_time_str(seconds)
-        logging.info("Hourly Message: There are " + time_str + "  between now and then.")
-        logging.info("Hourly Message: Waiting for " + time_str + " (" + str(seconds) + ") seconds...")
-        await asyncio.sleep(seconds)
-
-
-# Prepare to maintain daily and hourly message schedules.
-def set_up_scheduled_messages():
-    goose_bot.loop.create_task(daily_message(DAILY_MESSAGE_CHANNEL_ID, DAILY_MESSAGE))
-    goose_bot.loop.create_task(hourly_message(HOURLY_MESSAGE_CHANNEL_ID, HOURLY_MESSAGE))
+        send_message_in_channel(DAILY_MESSAGE_CHANNEL_ID, "Tip of the day: " + daily_tip)
 
 
-set_up_scheduled_messages()
+# Schedule the extra messages listed in SCHEDULED_MESSAGES_CONFIG, a JSON list of objects such as
+# {"name": "raid-reminder", "channel_id": 0, "message": "Raid hour!", "cron": "0 18 * * 3"}
+# where "interval" (in seconds) may be given instead of "cron", along with an optional "misfire_grace".
+def load_scheduled_messages(file_name):
+    try:
+        with open(file_name, encoding="utf-8") as config_file:
+            entries = json.load(config_file)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError):
+        scheduler_log.warning("Could not read scheduled messages from %s.", file_name)
+        return
+    for entry in entries:
+        try:
+            schedule_message(entry["name"], int(entry["channel_id"]), entry["message"], cron=entry.get("cron"),
+                             interval=entry.get("interval"), misfire_grace=entry.get("misfire_grace"))
+        except (KeyError, TypeError, ValueError):
+            scheduler_log.warning("Skipping a malformed scheduled message in %s.", file_name)
+
 
-# Run the bot!
-goose_bot.run(BOT_TOKEN)
+# Prepare to maintain daily and hourly message schedules, the cleanup of temporary messages, reaction roles
+# and telemetry.
+def set_up_scheduled_messages():
+    goose_bot.loop.create_task(janitor.run())
+    goose_bot.loop.create_task(reaction_router.run())
+    scheduler.add_cron_job("daily_message",
+                           str(DAILY_MESSAGE_TIME.minute) + " " + str(DAILY_MESSAGE_TIME.hour) + " * * *",
+                           send_daily_tip)
+    schedule_message("hourly_message", HOURLY_MESSAGE_CHANNEL_ID, HOURLY_MESSAGE,
+                     cron="0 * * * *", misfire_grace=HOURLY_MESSAGE_MISFIRE_GRACE, priority=LOW)
+    load_scheduled_messages(SCHEDULED_MESSAGES_CONFIG)
+    goose_bot.loop.create_task(scheduler.run())
+    telemetry.extra["reaction_role_api_calls_saved"] = role_batcher.api_calls_saved
+    telemetry.extra["janitor_pending_deletions"] = lambda: len(janitor.pending)
+    telemetry.extra["scheduled_jobs"] = lambda: len(scheduler.jobs)
+    telemetry.extra["member_cache_size"] = lambda: len(member_cache.entries)
+    telemetry.extra["member_fetches"] = lambda: member_cache.counters["fetches"]
+    telemetry.extra["outbox_pending"] = outbox.pending
+    telemetry.extra["outbox_coalesced"] = lambda: outbox.counters["coalesced"]
+    telemetry.extra["outbox_dropped"] = lambda: outbox.counters["dropped"]
+    telemetry.start(STATS_FILE_NAME, STATS_PORT)
+
+
+# Only start up when run directly, so the benchmarks can import the bot's handlers.
+if __name__ == '__main__':
+    set_up_scheduled_messages()
+
+    # Run the bot!
+    goose_bot.run(BOT_TOKEN)
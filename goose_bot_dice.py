@@ -0,0 +1,236 @@
+# Dice engine for the .roll command.
+# Expressions such as "4d6kh3+2d8-1" are parsed once into a cached list of terms. Small pools are rolled and shown
+# die by die; large pools are rolled in batches and summarised (sum, min/max, histogram) without keeping every roll.
+# Big rolls run one at a time in a worker thread of their own, so they never hold up the event loop, and a burst of
+# them can't take over the default executor or the GIL.
+
+import asyncio
+import random
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+MAX_EXPRESSION_LENGTH = 100
+MAX_TERMS = 20
+MAX_SIDES = 1000000
+MAX_DICE = 1000000  # Across the whole expression; a roll this big takes a few hundred milliseconds.
+DETAIL_LIMIT = 100  # Pools up to this size are shown roll by roll.
+HISTOGRAM_MAX_SIDES = 20  # Summaries of dice up to this size include how often each face came up.
+SELECTION_LIMIT = 100000  # Largest number of dice a keep/drop modifier can single out of a big pool of big dice.
+OFFLOAD_THRESHOLD = 20000  # Rolls with more dice than this run in a worker thread.
+ROLL_WORKERS = 1  # Worker threads for big rolls; more only compete for the GIL with each other and the event loop.
+BATCH_SIZE = 65536
+MESSAGE_LIMIT = 2000
+
+roll_executor = ThreadPoolExecutor(max_workers=ROLL_WORKERS, thread_name_prefix="dice")
+
+TERM_PATTERN = re.compile(r"([+-])(?:(\d*)d(\d+|%)(?:(kh|kl|dh|dl|k)(\d+))?|(\d+))")
+
+
+class DiceError(ValueError):
+    pass
+
+
+class DiceTerm:
+    def __init__(self, sign, count, sides, modifier=None, modifier_count=0):
+        self.sign = sign
+        self.count = count
+        self.sides = sides
+        # Normalise the modifier to the number of highest (or lowest) dice that are kept.
+        if modifier in ("kh", "k"):
+            self.keep, self.keep_highest = min(modifier_count, count), True
+        elif modifier == "kl":
+            self.keep, self.keep_highest = min(modifier_count, count), False
+        elif modifier == "dh":
+            self.keep, self.keep_highest = max(count - modifier_count, 0), False
+        elif modifier == "dl":
+            self.keep, self.keep_highest = max(count - modifier_count, 0), True
+        else:
+            self.keep, self.keep_highest = count, True
+        self.text = str(count) + "d" + str(sides) + (modifier + str(modifier_count) if modifier else "")
+
+
+class ConstantTerm:
+    def __init__(self, sign, value):
+        self.sign = sign
+        self.value = value
+        self.text = str(value)
+
+
+class TermResult:
+    def __init__(self, term, total, rolls=None, dropped=(), minimum=None, maximum=None, histogram=None):
+        self.term = term
+        self.total = total
+        self.rolls = rolls
+        self.dropped = dropped  # Indices into rolls that were not kept.
+        self.minimum = minimum
+        self.maximum = maximum
+        self.histogram = histogram
+
+
+# Parse a dice expression into a tuple of terms. Results are cached, so repeated expressions cost nothing to parse.
+@lru_cache(maxsize=256)
+def compile_expression(expression):
+    text = expression.replace(" ", "").lower()
+    if not text:
+        raise DiceError("Give me some dice to roll, like `2d6` or `4d6kh3+2`.")
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise DiceError("That expression is too long.")
+    if text[0] not in "+-":
+        text = "+" + text
+
+    terms = []
+    position = 0
+    while position < len(text):
+        match = TERM_PATTERN.match(text, position)
+        if match is None:
+            raise DiceError("I couldn't understand that roll. Try something like `4d6kh3+2d8-1`.")
+        position = match.end()
+        sign, count, sides, modifier, modifier_count, constant = match.groups()
+        sign = -1 if sign == "-" else 1
+        if constant is not None:
+            terms.append(ConstantTerm(sign, int(constant)))
+            continue
+        count = int(count) if count else 1
+        sides = 100 if sides == "%" else int(sides)
+        if count < 1 or sides < 1:
+            raise DiceError("Dice need at least one die and one side.")
+        if sides > MAX_SIDES:
+            raise DiceError("Dice can have at most " + str(MAX_SIDES) + " sides.")
+        terms.append(DiceTerm(sign, count, sides, modifier, int(modifier_count or 0)))
+        if len(terms) > MAX_TERMS:
+            raise DiceError("That's too many terms; the limit is " + str(MAX_TERMS) + ".")
+
+    dice_count = sum(t.count for t in terms if isinstance(t, DiceTerm))
+    if dice_count > MAX_DICE:
+        raise DiceError("That's too many dice; the limit is " + str(MAX_DICE) + " per roll.")
+    for t in terms:
+        if isinstance(t, DiceTerm) and t.count > DETAIL_LIMIT and t.sides > HISTOGRAM_MAX_SIDES \
+                and min(t.keep, t.count - t.keep) > SELECTION_LIMIT:
+            raise DiceError("`" + t.text + "` keeps or drops too many dice to track.")
+    return tuple(terms)
+
+
+def dice_count(terms):
+    return sum(t.count for t in terms if isinstance(t, DiceTerm))
+
+
+# Roll a small pool die by die so every roll can be shown.
+def roll_detailed(term):
+    rolls = random.choices(range(1, term.sides + 1), k=term.count)
+    dropped = ()
+    if term.keep < term.count:
+        order = sorted(range(term.count), key=rolls.__getitem__, reverse=term.keep_highest)
+        dropped = frozenset(order[term.keep:])
+    total = sum(r for i, r in enumerate(rolls) if i not in dropped)
+    return TermResult(term, total, rolls=rolls, dropped=dropped)
+
+
+# Roll a large pool in batches, keeping only running totals and, for small dice, a histogram of faces.
+def roll_summarised(term):
+    faces = range(1, term.sides + 1)
+    histogram = Counter() if term.sides <= HISTOGRAM_MAX_SIDES else None
+    selected = []  # The dice a keep/drop modifier singles out, when there's no histogram to work from.
+    select_count = min(term.keep, term.count - term.keep)
+    select_highest = term.keep_highest == (select_count == term.keep)
+    total = 0
+    minimum = term.sides
+    maximum = 1
+    remaining = term.count
+    while remaining:
+        batch = random.choices(faces, k=min(BATCH_SIZE, remaining))
+        remaining -= len(batch)
+        total += sum(batch)
+        minimum = min(minimum, min(batch))
+        maximum = max(maximum, max(batch))
+        if histogram is not None:
+            histogram.update(batch)
+        elif select_count:
+            pool = selected + batch
+            selected = sorted(pool, reverse=select_highest)[:select_count]
+
+    if term.keep < term.count:
+        if histogram is not None:
+            selected = []
+            faces_in_order = sorted(histogram, reverse=select_highest)
+            still_needed = select_count
+            selected_total = 0
+            for face in faces_in_order:
+                taken = min(still_needed, histogram[face])
+                selected_total += face * taken
+                still_needed -= taken
+                if not still_needed:
+                    break
+        else:
+            selected_total = sum(selected)
+        # Either the selected dice are the ones kept, or they are the ones dropped.
+        total = selected_total if select_count == term.keep else total - selected_total
+    return TermResult(term, total, minimum=minimum, maximum=maximum, histogram=histogram)
+
+
+# Roll every term of a compiled expression. Returns the results and the grand total.
+def evaluate(terms):
+    results = []
+    grand_total = 0
+    for t in terms:
+        if isinstance(t, ConstantTerm):
+            result = TermResult(t, t.value)
+        elif t.count <= DETAIL_LIMIT:
+            result = roll_detailed(t)
+        else:
+            result = roll_summarised(t)
+        results.append(result)
+        grand_total += t.sign * result.total
+    return results, grand_total
+
+
+def format_count(count):
+    if count >= 1000000:
+        return str(round(count / 1000000, 1)) + "M"
+    if count >= 10000:
+        return str(round(count / 1000)) + "k"
+    return str(count)
+
+
+def format_result(result):
+    term = result.term
+    sign = "-" if term.sign < 0 else "+"
+    if isinstance(term, ConstantTerm):
+        return sign + " " + str(term.value)
+    if result.rolls is not None:
+        rolls = ", ".join("~~" + str(r) + "~~" if i in result.dropped else str(r) for i, r in enumerate(result.rolls))
+        return sign + " `" + term.text + "`: " + rolls + " (" + str(result.total) + ")"
+    line = (sign + " `" + term.text + "`: " + str(result.total) + " (min " + str(result.minimum)
+            + ", max " + str(result.maximum) + ", mean " + "%.2f" % (result.total / term.keep if term.keep else 0) + ")")
+    if result.histogram is not None:
+        line += "\n" + ", ".join(str(face) + ": " + format_count(result.histogram[face])
+                                 for face in range(1, term.sides + 1))
+    return line
+
+
+# Describe a roll in at most MESSAGE_LIMIT characters.
+def format_roll(results, grand_total):
+    if len(results) == 1 and results[0].rolls is not None and not results[0].dropped and results[0].term.sign > 0:
+        # A plain NdN roll keeps the classic "1, 2, 3 (6)" format.
+        text = ", ".join(map(str, results[0].rolls)) + " (" + str(grand_total) + ")"
+    else:
+        lines = [format_result(r) for r in results]
+        lines[0] = lines[0][2:] if lines[0].startswith("+ ") else lines[0]
+        text = "\n".join(lines) + "\nTotal: **" + str(grand_total) + "**"
+    if len(text) > MESSAGE_LIMIT:
+        total_line = "\n... Total: **" + str(grand_total) + "**"
+        text = text[:MESSAGE_LIMIT - len(total_line)] + total_line
+    return text
+
+
+# Roll a dice expression and describe the result, off the event loop for big rolls.
+# Raises DiceError if the expression is malformed or too big.
+async def roll(expression):
+    terms = compile_expression(expression)
+    if dice_count(terms) > OFFLOAD_THRESHOLD:
+        loop = asyncio.get_event_loop()
+        results, grand_total = await loop.run_in_executor(roll_executor, evaluate, terms)
+    else:
+        results, grand_total = evaluate(terms)
+    return format_roll(results, grand_total)
@@ -0,0 +1,124 @@
+# Background deletion of short-lived bot messages, such as reaction role confirmations.
+# Pending deletions are kept in a time-ordered heap and saved to disk so they survive restarts.
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import discord
+
+log = logging.getLogger("goose_bot.janitor")
+
+# Discord refuses to bulk delete more than 100 messages at once, or any message older than 14 days.
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = timedelta(days=13, hours=23)
+
+
+class MessageJanitor:
+    def __init__(self, bot, file_name):
+        self.bot = bot
+        self.file_name = file_name
+        self.pending = []  # Heap of (delete_at, channel_id, message_id).
+        self.wake_up = asyncio.Event()
+        self.dirty = False
+        self.load()
+
+    # Queue a message for deletion after the given number of seconds. Returns immediately.
+    def schedule(self, message, delay):
+        self.schedule_id(message.channel.id, message.id, delay)
+
+    def schedule_id(self, channel_id, message_id, delay):
+        heapq.heappush(self.pending, (time.time() + delay, channel_id, message_id))
+        self.dirty = True
+        self.wake_up.set()
+
+    # Restore the pending deletions left over from a previous run.
+    def load(self):
+        try:
+            with open(self.file_name) as janitor_file:
+                entries = json.load(janitor_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            log.warning("Could not read pending deletions from %s.", self.file_name)
+            return
+        self.pending = [(float(delete_at), int(channel_id), int(message_id))
+                        for delete_at, channel_id, message_id in entries]
+        heapq.heapify(self.pending)
+        log.info("Restored %d pending deletions.", len(self.pending))
+
+    # Write the pending deletions to disk, replacing the old file in one step.
+    def save(self):
+        temp_file_name = self.file_name + ".tmp"
+        try:
+            with open(temp_file_name, "w") as janitor_file:
+                json.dump(self.pending, janitor_file)
+            os.replace(temp_file_name, self.file_name)
+        except OSError:
+            log.warning("Could not save pending deletions to %s.", self.file_name)
+            return
+        self.dirty = False
+
+    # Pop every deletion that is due, grouped by channel.
+    def pop_due(self, now):
+        due = {}
+        while self.pending and self.pending[0][0] <= now:
+            delete_at, channel_id, message_id = heapq.heappop(self.pending)
+            # A message can be scheduled more than once, e.g. when several confirmations were sent as one.
+            due.setdefault(channel_id, {})[message_id] = None
+        if due:
+            self.dirty = True
+        return {channel_id: list(message_ids) for channel_id, message_ids in due.items()}
+
+    # Delete a batch of messages from one channel, using a bulk delete where Discord allows it.
+    async def delete_in_channel(self, channel_id, message_ids):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+        oldest_bulk_time = datetime.utcnow() - BULK_DELETE_MAX_AGE
+        bulk_ids = []
+        single_ids = []
+        for message_id in message_ids:
+            if discord.utils.snowflake_time(message_id) > oldest_bulk_time:
+                bulk_ids.append(message_id)
+            else:
+                single_ids.append(message_id)
+        if len(bulk_ids) > 1:
+            for start in range(0, len(bulk_ids), BULK_DELETE_LIMIT):
+                chunk = [discord.Object(id=message_id) for message_id in bulk_ids[start:start + BULK_DELETE_LIMIT]]
+                try:
+                    await channel.delete_messages(chunk)
+                except discord.Forbidden:
+                    # Bulk deletion needs Manage Messages; a bot can always delete its own messages one by one.
+                    single_ids.extend(message.id for message in chunk)
+                except discord.HTTPException:
+                    pass
+        else:
+            single_ids.extend(bulk_ids)
+        for message_id in single_ids:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.HTTPException:
+                pass
+
+    # Sleep until the earliest pending deletion is due, then delete everything that has expired.
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            self.wake_up.clear()
+            due = self.pop_due(time.time())
+            for channel_id, message_ids in due.items():
+                await self.delete_in_channel(channel_id, message_ids)
+            if self.dirty:
+                self.save()
+            timeout = self.pending[0][0] - time.time() if self.pending else None
+            if timeout is not None and timeout <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self.wake_up.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,89 @@
+# Logging set up for the bot.
+# Records are handed to a queue and written to disk by a listener thread, so logging never blocks the event loop.
+# Messages use lazy %-style arguments and are only formatted by the listener, after level filtering.
+# Log files rotate by size and by age, and each subsystem has its own logger and level.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Per-subsystem loggers. Their levels can be set with e.g. LOG_LEVEL_REACTION_ROLES=DEBUG in the environment file.
+SUBSYSTEMS = {
+    "REACTION_ROLES": "goose_bot.reaction_roles",
+    "ROLE_MANAGEMENT": "goose_bot.role_management",
+    "DICE": "goose_bot.dice",
+    "SCHEDULER": "goose_bot.scheduler",
+    "JANITOR": "goose_bot.janitor",
+    "STATS": "goose_bot.stats",
+    "MEMBERS": "goose_bot.members",
+    "TIPS": "goose_bot.tips",
+    "OUTBOX": "goose_bot.outbox",
+}
+
+
+# A queue handler that passes records on untouched. The standard one formats every message on the calling thread.
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+# A file handler that rolls over when the file gets too big or too old, whichever comes first.
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    def __init__(self, file_name, max_bytes, backup_count, interval):
+        super().__init__(file_name, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.interval = interval
+        try:
+            self.next_rollover = os.stat(file_name).st_mtime + interval
+        except OSError:
+            self.next_rollover = time.time() + interval
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() >= self.next_rollover:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.next_rollover = time.time() + self.interval
+
+
+# One JSON object per line, for feeding logs to other tools.
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Route every log record through a queue to a rotating file written by a listener thread.
+def set_up_logging(file_name, json_format=False, max_bytes=5 * 1024 * 1024, backup_count=5, interval=24 * 60 * 60,
+                   level=logging.INFO):
+    file_handler = SizeAndTimeRotatingFileHandler(file_name, max_bytes, backup_count, interval)
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(LazyQueueHandler(log_queue))
+
+    for subsystem, logger_name in SUBSYSTEMS.items():
+        subsystem_level = os.getenv('LOG_LEVEL_' + subsystem)
+        if subsystem_level:
+            logging.getLogger(logger_name).setLevel(subsystem_level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
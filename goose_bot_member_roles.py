@@ -0,0 +1,50 @@
+# Role edits shared by the reaction role batcher and the .role command.
+# discord.py only updates a member's cached roles once Discord echoes an edit back over the gateway, so an edit planned
+# from the cache before then would undo the one before it. Edits for one member therefore take turns, and each edit is
+# remembered until the echo arrives, so the next one can be planned from the roles the member really has.
+
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
+
+# Seconds an edit is remembered for; Discord echoes it back over the gateway long before then.
+LAST_EDIT_LIFETIME = 60
+
+
+class MemberRoleEdits:
+    def __init__(self, lifetime=LAST_EDIT_LIFETIME):
+        self.lifetime = lifetime
+        self.locks = weakref.WeakValueDictionary()  # (guild_id, member_id) -> Lock, while anyone holds or awaits it.
+        # (guild_id, member_id) -> (role ids before, role ids after, forget at) of the last edit, oldest first.
+        self.last_edit = OrderedDict()
+
+    # The lock to hold while working out and applying a member's new roles.
+    def lock(self, guild_id, member_id):
+        key = (guild_id, member_id)
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        return lock
+
+    # A member's roles without @everyone, including our last edit if the gateway hasn't caught up with it yet.
+    def current_roles(self, member):
+        roles = [r for r in member.roles if not r.is_default()]
+        before_ids, after_ids, forget_at = self.last_edit.get((member.guild.id, member.id), (None, None, 0))
+        if forget_at > time.monotonic() and {r.id for r in roles} == before_ids:
+            roles = [r for r in (member.guild.get_role(role_id) for role_id in after_ids) if r is not None]
+        return roles
+
+    # Replace a member's roles with one edit. Raises discord.HTTPException if the edit fails.
+    async def replace_roles(self, member, roles):
+        seen_ids = {r.id for r in member.roles if not r.is_default()}
+        await member.edit(roles=roles)
+        self.remember_edit((member.guild.id, member.id), seen_ids, {r.id for r in roles})
+
+    # Remember an edit until the gateway has caught up with it, forgetting any that are too old to matter.
+    def remember_edit(self, key, before_ids, after_ids):
+        now = time.monotonic()
+        while self.last_edit and next(iter(self.last_edit.values()))[2] <= now:
+            self.last_edit.popitem(last=False)
+        self.last_edit.pop(key, None)
+        self.last_edit[key] = (before_ids, after_ids, now + self.lifetime)
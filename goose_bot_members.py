@@ -0,0 +1,77 @@
+# On-demand member lookups for the lightweight member cache mode.
+# Instead of downloading every member of every guild at startup, members are taken from the event that mentions
+# them or fetched when first needed, and kept in a bounded LRU cache whose entries expire after a while.
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import discord
+
+log = logging.getLogger("goose_bot.members")
+
+
+class MemberCache:
+    def __init__(self, max_size=5000, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # (guild_id, member_id) -> (expires_at, member), least recently used first.
+        self.fetching = {}  # (guild_id, member_id) -> Task, so concurrent lookups share one request.
+        self.counters = {"hits": 0, "misses": 0, "fetches": 0, "not_found": 0}
+
+    def put(self, member):
+        key = (member.guild.id, member.id)
+        self.entries[key] = (self.clock() + self.ttl, member)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, guild_id, member_id):
+        key = (guild_id, member_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, member = entry
+        if expires_at <= self.clock():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return member
+
+    # Find a member, preferring one that came with the event, then the guild's own cache, then ours, then the API.
+    # Returns None if the member has left the guild or can't be fetched.
+    async def resolve(self, guild, member_id, member=None):
+        if member is not None:
+            self.put(member)
+            return member
+        member = guild.get_member(member_id) or self.get(guild.id, member_id)
+        if member is not None:
+            self.counters["hits"] += 1
+            return member
+        self.counters["misses"] += 1
+
+        key = (guild.id, member_id)
+        task = self.fetching.get(key)
+        if task is None:
+            task = self.fetching[key] = asyncio.ensure_future(self.fetch(guild, member_id))
+            task.add_done_callback(lambda done: self.fetching.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def fetch(self, guild, member_id):
+        self.counters["fetches"] += 1
+        try:
+            member = await guild.fetch_member(member_id)
+        except discord.NotFound:
+            self.counters["not_found"] += 1
+            log.info("Member %s is no longer in %s.", member_id, guild.name)
+            return None
+        except discord.HTTPException:
+            log.warning("Could not fetch member %s of %s.", member_id, guild.name)
+            return None
+        self.put(member)
+        return member
+
+    def forget(self, guild_id, member_id):
+        self.entries.pop((guild_id, member_id), None)
@@ -0,0 +1,192 @@
+# One outbound pipeline for every message the bot sends.
+# Each channel has a queue, drained by its own task at the pace Discord allows messages in a channel. Texts that pile
+# up while a channel waits for its rate limit are joined into as few messages as fit, most important first, and
+# low priority texts that have waited too long, or don't fit in a full queue, are dropped.
+# Senders get a future for the message instead of waiting for the HTTP round trip.
+# Nothing the bot sends pings anyone unless the sender asks for it, since most texts quote names or input from members.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+import discord
+
+from goose_bot_utils import MESSAGE_LIMIT
+
+log = logging.getLogger("goose_bot.outbox")
+
+HIGH = 0  # Replies to commands.
+NORMAL = 1  # Confirmations and scheduled messages.
+LOW = 2  # Messages nobody is waiting for, such as check-ins.
+
+# Discord allows about 5 messages per 5 seconds in a channel, and 50 requests a second overall.
+CHANNEL_RATE = (5, 5.0)
+GLOBAL_RATE = (50, 1.0)
+LOW_PRIORITY_MAX_WAIT = 60  # Seconds a low priority text may wait before it is dropped.
+MAX_QUEUED = 100  # Texts per channel; past this the least important, oldest text is dropped.
+NO_MENTIONS = discord.AllowedMentions.none()
+
+
+# A token bucket refilling continuously at limit tokens per `per` seconds.
+class SendBucket:
+    def __init__(self, limit, per, clock=time.monotonic):
+        self.limit = limit
+        self.per = per
+        self.clock = clock
+        self.tokens = float(limit)
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.per)
+        self.updated = now
+
+    # Seconds until a token is available.
+    def delay(self):
+        self.refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) * self.per / self.limit
+
+    def take(self):
+        self.refill()
+        self.tokens -= 1
+
+
+class OutgoingText:
+    def __init__(self, text, priority, coalesce, allowed_mentions, expires_at, future):
+        self.text = text
+        self.priority = priority
+        self.coalesce = coalesce
+        self.allowed_mentions = allowed_mentions
+        self.expires_at = expires_at
+        self.future = future
+
+
+class Outbox:
+    def __init__(self, bot, channel_rate=CHANNEL_RATE, global_rate=GLOBAL_RATE, max_queued=MAX_QUEUED,
+                 clock=time.monotonic):
+        self.bot = bot
+        self.channel_rate = channel_rate
+        self.max_queued = max_queued
+        self.clock = clock
+        self.global_bucket = SendBucket(*global_rate, clock=clock)
+        self.buckets = {}  # channel_id -> SendBucket
+        self.queues = {}  # channel_id -> heap of (priority, sequence, OutgoingText)
+        self.workers = {}  # channel_id -> Task draining that channel's queue
+        self.channels = {}  # channel_id -> channel
+        self.sequence = itertools.count()
+        self.counters = {"queued": 0, "messages": 0, "coalesced": 0, "dropped": 0, "failed": 0}
+
+    # Queue a text for a channel, given as a channel or its ID. Returns a future for the discord.Message it ends up
+    # in, which is None if the text was dropped or couldn't be sent.
+    # Only texts with equal coalesce values share a message, so texts that are deleted after a while can be kept
+    # apart from ones that should stay. Texts sent with coalesce=False always get a message of their own, e.g.
+    # because reactions will be added to it. Mentions only ping anyone if allowed_mentions says so.
+    def send(self, channel, text, priority=NORMAL, coalesce=True, max_wait=None, allowed_mentions=NO_MENTIONS):
+        if isinstance(channel, int):
+            channel_id = channel
+        else:
+            channel_id = channel.id
+            self.channels[channel_id] = channel
+        if max_wait is None and priority == LOW:
+            max_wait = LOW_PRIORITY_MAX_WAIT
+        future = self.bot.loop.create_future()
+        item = OutgoingText(text, priority, coalesce, allowed_mentions,
+                            None if max_wait is None else self.clock() + max_wait, future)
+        queue = self.queues.setdefault(channel_id, [])
+        heapq.heappush(queue, (priority, next(self.sequence), item))
+        self.counters["queued"] += 1
+        if len(queue) > self.max_queued:
+            self.drop_least_important(queue)
+        if channel_id not in self.workers:
+            self.workers[channel_id] = self.bot.loop.create_task(self.drain(channel_id))
+        return future
+
+    def drop_least_important(self, queue):
+        index = max(range(len(queue)), key=lambda i: (queue[i][0], -queue[i][1]))
+        item = queue[index][2]
+        queue[index] = queue[-1]
+        queue.pop()
+        heapq.heapify(queue)
+        log.info("Dropped a queued message because the queue is full: %s", item.text[:50])
+        self.finish([item], None, "dropped")
+
+    def finish(self, items, message, counter=None):
+        if counter is not None:
+            self.counters[counter] += len(items)
+        for item in items:
+            if not item.future.done():
+                item.future.set_result(message)
+
+    # Take the next message's worth of texts off a queue, dropping any that have waited too long.
+    def take_batch(self, queue):
+        now = self.clock()
+        batch = []
+        length = 0
+        while queue:
+            item = queue[0][2]
+            if item.expires_at is not None and item.expires_at <= now:
+                heapq.heappop(queue)
+                log.info("Dropped a message that waited too long: %s", item.text[:50])
+                self.finish([item], None, "dropped")
+                continue
+            if batch and (batch[0].coalesce is False or item.coalesce != batch[0].coalesce
+                          or item.allowed_mentions is not batch[0].allowed_mentions
+                          or length + 1 + len(item.text) > MESSAGE_LIMIT):
+                break
+            heapq.heappop(queue)
+            batch.append(item)
+            length += len(item.text) + (1 if len(batch) > 1 else 0)
+        return batch
+
+    def get_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.bot.get_channel(channel_id)
+            if channel is not None:
+                self.channels[channel_id] = channel
+        return channel
+
+    # Send everything queued for a channel, waiting for the channel's and the global rate limit before each message.
+    async def drain(self, channel_id):
+        queue = self.queues[channel_id]
+        bucket = self.buckets.get(channel_id)
+        if bucket is None:
+            bucket = self.buckets[channel_id] = SendBucket(*self.channel_rate, clock=self.clock)
+        try:
+            if not self.bot.is_ready():
+                await self.bot.wait_until_ready()
+            channel = self.get_channel(channel_id)
+            if channel is None:
+                log.warning("Can't send %d messages to unknown channel %s.", len(queue), channel_id)
+                self.finish([entry[2] for entry in queue], None, "failed")
+                queue.clear()
+                return
+            while queue:
+                delay = max(bucket.delay(), self.global_bucket.delay())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                batch = self.take_batch(queue)
+                if not batch:
+                    continue
+                bucket.take()
+                self.global_bucket.take()
+                try:
+                    message = await channel.send("\n".join(item.text for item in batch),
+                                                 allowed_mentions=batch[0].allowed_mentions)
+                except Exception:
+                    log.exception("Could not send a message to %s.", channel_id)
+                    self.finish(batch, None, "failed")
+                    continue
+                self.counters["messages"] += 1
+                self.counters["coalesced"] += len(batch) - 1
+                self.finish(batch, message)
+        finally:
+            del self.workers[channel_id]
+            if not queue:
+                del self.queues[channel_id]
+
+    def pending(self):
+        return sum(len(queue) for queue in self.queues.values())
@@ -0,0 +1,98 @@
+# Precomputed routing table for reaction roles.
+# Maps each watched message ID to its emoji keys and the discord.Role objects they grant, so a raw reaction event
+# needs one set lookup to be rejected and two dict lookups to be routed.
+# The table is rebuilt in the background whenever the config file changes or the guild's roles change.
+
+import asyncio
+import json
+import logging
+import os
+
+log = logging.getLogger("goose_bot.reaction_roles")
+
+
+# Custom emoji are keyed by ID and unicode emoji by their name, matching what a raw reaction event carries.
+def emoji_key(emoji):
+    if isinstance(emoji, int):
+        return emoji
+    if isinstance(emoji, str):
+        return int(emoji) if emoji.isdigit() else emoji
+    if emoji.id is None:
+        return emoji.name
+    return emoji.id
+
+
+# Turn an emoji -> role ID dict, as found in extended_emoji_dict, into one keyed by emoji_key.
+def compile_emoji_dict(emoji_to_role):
+    return {emoji_key(emoji): int(role_id) for emoji, role_id in emoji_to_role.items()}
+
+
+class ReactionRoleRouter:
+    def __init__(self, bot, config_file_name, default_config=None):
+        self.bot = bot
+        self.config_file_name = config_file_name
+        self.config_mtime = None
+        self.config = default_config or {}  # message_id -> {emoji_key: role_id}
+        self.routes = {}  # message_id -> {emoji_key: discord.Role}
+        self.watched = frozenset(self.config)
+        self.rebuild_needed = asyncio.Event()
+        self.load_config()
+
+    # Find the role granted by a reaction, or None if the reaction doesn't grant one.
+    def route(self, payload):
+        routes = self.routes.get(payload.message_id)
+        if routes is None:
+            return None
+        emoji = payload.emoji
+        role = routes.get(emoji.name if emoji.id is None else emoji.id)
+        if role is None or role.guild.id != payload.guild_id:
+            return None
+        return role
+
+    # Ask the background task to rebuild the table, e.g. after the guild's roles changed.
+    def request_rebuild(self):
+        self.rebuild_needed.set()
+
+    # Read the config file if it changed since the last read. Returns whether it did.
+    # The file maps message IDs to {emoji: role ID}, where an emoji is a unicode emoji or a custom emoji ID.
+    def load_config(self):
+        try:
+            mtime = os.stat(self.config_file_name).st_mtime
+        except OSError:
+            return False
+        if mtime == self.config_mtime:
+            return False
+        self.config_mtime = mtime
+        try:
+            with open(self.config_file_name, encoding="utf-8") as config_file:
+                raw_config = json.load(config_file)
+            self.config = {int(message_id): compile_emoji_dict(emoji_to_role)
+                           for message_id, emoji_to_role in raw_config.items()}
+        except (OSError, ValueError, AttributeError, TypeError):
+            log.warning("Could not read reaction roles from %s.", self.config_file_name)
+            return False
+        log.info("Loaded %d watched messages from %s.", len(self.config), self.config_file_name)
+        return True
+
+    # Resolve every configured role ID to its discord.Role and swap the new table in.
+    def rebuild(self):
+        roles = {r.id: r for guild in self.bot.guilds for r in guild.roles}
+        routes = {}
+        for message_id, emoji_to_role in self.config.items():
+            routes[message_id] = {key: roles[role_id] for key, role_id in emoji_to_role.items() if role_id in roles}
+        self.routes = routes
+        self.watched = frozenset(routes)
+        log.info("Routing %d reactions on %d messages.", sum(len(r) for r in routes.values()), len(routes))
+
+    # Keep the table current, checking the config file every poll_interval seconds.
+    async def run(self, poll_interval=10):
+        await self.bot.wait_until_ready()
+        self.rebuild()
+        while True:
+            try:
+                await asyncio.wait_for(self.rebuild_needed.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self.load_config() or self.rebuild_needed.is_set():
+                self.rebuild_needed.clear()
+                self.rebuild()
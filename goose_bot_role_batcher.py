@@ -0,0 +1,139 @@
+# Coalesces reaction role changes into a single role edit per member.
+# Each member's adds and removes are collected over a short window, changes that flip back cancel out,
+# and the net result is applied with one Member.edit(roles=...) call, or with one request per role for members the
+# bot has no up to date copy of.
+
+import asyncio
+import logging
+import time
+
+import discord
+
+log = logging.getLogger("goose_bot.reaction_roles")
+
+
+class PendingRoleChange:
+    def __init__(self, guild, member_id, member):
+        self.guild = guild
+        self.member_id = member_id
+        self.member = member
+        self.changes = {}  # role_id -> (role, add), the latest request wins.
+        self.first_event = time.monotonic()
+        self.timer = None
+
+
+class RoleChangeBatcher:
+    def __init__(self, resolve_member, on_applied, member_roles, window=1.5, max_delay=5.0, max_changes=25):
+        self.resolve_member = resolve_member
+        self.on_applied = on_applied
+        self.member_roles = member_roles  # MemberRoleEdits shared with the .role command
+        self.window = window
+        self.max_delay = max_delay
+        self.max_changes = max_changes
+        self.pending = {}  # (guild_id, member_id) -> PendingRoleChange
+        self.flushing = {}  # (guild_id, member_id) -> Task, so a member's batches are applied in order.
+        self.counters = {
+            "events": 0,
+            "cancelled": 0,
+            "member_edits": 0,
+            "confirmations": 0,
+            "failed_edits": 0,
+        }
+
+    # Record that a member should gain (add=True) or lose (add=False) a role. Returns immediately.
+    def queue(self, guild, member_id, role, add, member=None):
+        self.counters["events"] += 1
+        key = (guild.id, member_id)
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = PendingRoleChange(guild, member_id, member)
+        elif member is not None:
+            pending.member = member
+        pending.changes[role.id] = (role, add)
+
+        if pending.timer is not None:
+            pending.timer.cancel()
+        if len(pending.changes) >= self.max_changes:
+            delay = 0
+        else:
+            deadline = pending.first_event + self.max_delay
+            delay = max(0, min(self.window, deadline - time.monotonic()))
+        pending.timer = asyncio.get_event_loop().call_later(delay, self.start_flush, key)
+
+    def start_flush(self, key):
+        pending = self.pending.pop(key, None)
+        if pending is None:
+            return
+        task = asyncio.ensure_future(self.flush(key, pending, self.flushing.get(key)))
+        self.flushing[key] = task
+        task.add_done_callback(lambda done: self.flushing.pop(key) if self.flushing.get(key) is done else None)
+
+    # Apply the net change for one member with a single edit, once any earlier edit for them has finished.
+    async def flush(self, key, pending, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        await self.apply(pending)
+
+    async def apply(self, pending):
+        member = await self.resolve_member(pending.guild, pending.member_id, pending.member)
+        if member is None:
+            self.counters["cancelled"] += len(pending.changes)
+            log.warning("Could not find member %s to update their roles.", pending.member_id)
+            return
+        async with self.member_roles.lock(pending.guild.id, pending.member_id):
+            # Without a member from the event or the guild's cache (lazy member mode), all we have is a snapshot that
+            # may be minutes old, and replacing the member's whole role list from it would undo anyone else's changes
+            # since.
+            if pending.member is None and pending.guild.get_member(pending.member_id) is None:
+                applied = await self.apply_each(member, pending)
+            else:
+                applied = await self.apply_edit(member, pending)
+        if applied and await self.on_applied(member, *applied):
+            self.counters["confirmations"] += 1
+
+    # Apply the net change with a single edit. Returns the roles added and removed, or None if nothing was changed.
+    async def apply_edit(self, member, pending):
+        current_roles = self.member_roles.current_roles(member)
+        current_ids = {r.id for r in current_roles}
+        added = [role for role, add in pending.changes.values() if add and role.id not in current_ids]
+        removed = [role for role, add in pending.changes.values() if not add and role.id in current_ids]
+        self.counters["cancelled"] += len(pending.changes) - len(added) - len(removed)
+        if not added and not removed:
+            return None
+
+        removed_ids = {r.id for r in removed}
+        new_roles = [r for r in current_roles if r.id not in removed_ids] + added
+        try:
+            await self.member_roles.replace_roles(member, new_roles)
+        except discord.HTTPException:
+            self.counters["failed_edits"] += 1
+            log.warning("Could not update the roles of %s.", member.display_name)
+            return None
+        self.counters["member_edits"] += 1
+        log.info("Updated roles for %s with one edit (%d added, %d removed).",
+                 member.display_name, len(added), len(removed))
+        return added, removed
+
+    # Apply each change with its own add or remove request, which leaves the member's other roles alone.
+    async def apply_each(self, member, pending):
+        added = [role for role, add in pending.changes.values() if add]
+        removed = [role for role, add in pending.changes.values() if not add]
+        try:
+            if added:
+                await member.add_roles(*added)
+            if removed:
+                await member.remove_roles(*removed)
+        except discord.HTTPException:
+            self.counters["failed_edits"] += 1
+            log.warning("Could not update the roles of %s.", member.display_name)
+            return None
+        self.counters["member_edits"] += len(added) + len(removed)
+        log.info("Updated roles for %s one by one (%d added, %d removed).",
+                 member.display_name, len(added), len(removed))
+        return added, removed
+
+    # Each reaction used to cost one role request and one confirmation message.
+    def api_calls_saved(self):
+        naive_calls = self.counters["events"] * 2
+        actual_calls = self.counters["member_edits"] + self.counters["failed_edits"] + self.counters["confirmations"]
+        return naive_calls - actual_calls
@@ -0,0 +1,118 @@
+# Role changes for several members at once, for the .role command.
+# Arguments are roles, members or role diffs like +raids and -pvp. Each member's new set of roles is worked out with
+# set operations and applied with a single edit, and the members are edited a few at a time. Edits take turns with the
+# reaction role batcher's through MemberRoleEdits, so neither undoes the other's before the gateway catches up.
+
+import asyncio
+import logging
+
+import discord
+from discord.ext import commands
+
+log = logging.getLogger("goose_bot.role_management")
+
+ADD = "add"
+REMOVE = "remove"
+TOGGLE = "toggle"
+TRUNCATED = "\n(and more)"  # Ends a summary too long for one message.
+
+
+class RoleArgumentError(Exception):
+    pass
+
+
+# Sort the arguments into role changes (role -> ADD, REMOVE or TOGGLE) and members. A bare name is tried as a role
+# first and a member second; a name with + or - in front is always a role. Raises RoleArgumentError for anything
+# that can't be used.
+async def parse_role_arguments(ctx, arguments):
+    changes = {}
+    members = {}
+    for argument in arguments:
+        action = TOGGLE
+        name = argument
+        if len(argument) > 1 and argument[0] in "+-":
+            action = ADD if argument[0] == "+" else REMOVE
+            name = argument[1:]
+        try:
+            role = await commands.RoleConverter().convert(ctx, name)
+        except commands.BadArgument:
+            role = None
+        if role is not None:
+            if role.is_default() or role.managed or role >= ctx.guild.me.top_role:
+                raise RoleArgumentError("I can't assign `" + role.name.replace("@", "") + "`.")
+            changes[role] = action
+            continue
+        if action == TOGGLE:
+            try:
+                member = await commands.MemberConverter().convert(ctx, name)
+            except commands.BadArgument:
+                member = None
+            if member is not None:
+                members[member.id] = member
+                continue
+        raise RoleArgumentError("I don't know a role or member called `" + name.replace("@", "") + "`.")
+    return changes, list(members.values())
+
+
+# The roles a member with current_roles should end up with, as (new roles, added roles, removed roles).
+def plan_role_changes(current_roles, changes):
+    current = set(current_roles)
+    adds = {role for role, action in changes.items() if action == ADD}
+    removes = {role for role, action in changes.items() if action == REMOVE}
+    toggles = {role for role, action in changes.items() if action == TOGGLE}
+    new = ((current | adds) - removes) ^ toggles
+    return new, sorted(new - current), sorted(current - new)
+
+
+# Edit every member that needs it, at most `concurrency` at a time. Returns (member, added, removed, succeeded)
+# for each member, in order.
+async def apply_role_changes(members, changes, concurrency, member_roles):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def apply(member):
+        async with member_roles.lock(member.guild.id, member.id):
+            new, added, removed = plan_role_changes(member_roles.current_roles(member), changes)
+            if not added and not removed:
+                return member, added, removed, True
+            async with semaphore:
+                try:
+                    await member_roles.replace_roles(member, list(new))
+                except discord.HTTPException:
+                    log.warning("Could not update the roles of %s.", member.display_name)
+                    return member, added, removed, False
+        log.info("Updated roles for %s with one edit (%d added, %d removed).",
+                 member.display_name, len(added), len(removed))
+        return member, added, removed, True
+
+    return await asyncio.gather(*(apply(member) for member in members))
+
+
+# Describe one member's role changes, e.g. "Added `raids` to and removed `pvp` from Goose."
+def describe_role_changes(name, added, removed):
+    changes = []
+    if added:
+        changes.append("added " + ", ".join("`" + str(r) + "`" for r in added) + " to")
+    if removed:
+        changes.append("removed " + ", ".join("`" + str(r) + "`" for r in removed) + " from")
+    text = " and ".join(changes) + " " + name + "."
+    return text[0].upper() + text[1:]
+
+
+# One reply for the whole command, cut short if it doesn't fit in a message.
+def summarise_role_changes(author, results, limit):
+    lines = []
+    for member, added, removed, succeeded in results:
+        name = "you" if member.id == author.id else member.display_name
+        if not succeeded:
+            lines.append("Couldn't update the roles of " + name + ".")
+        elif not added and not removed:
+            lines.append("Nothing to change for " + name + ".")
+        else:
+            lines.append(describe_role_changes(name, added, removed))
+    text = "\n".join(lines)
+    if len(text) > limit:
+        cut = text.rfind("\n", 0, limit - len(TRUNCATED))
+        if cut == -1:
+            cut = limit - len(TRUNCATED)
+        text = text[:cut] + TRUNCATED
+    return text
@@ -0,0 +1,35 @@
+# Cached, pre-rendered role listings for the .roles command.
+# Each guild's roles are rendered and split into pages once, and thrown away when a role is created, updated or
+# deleted, so listing roles on a guild with hundreds of them costs a dict lookup.
+
+import goose_bot_utils
+
+
+class GuildRoleIndex:
+    def __init__(self, guild, prefix):
+        roles = guild.roles
+        self.rendered = {r.id: '`' + r.name.replace("@", "") + '`' for r in roles}
+        self.positions = {r.id: i for i, r in enumerate(roles)}
+        self.role_ids = frozenset(self.rendered)
+        self.pages = goose_bot_utils.paginate([self.rendered[r.id] for r in roles], prefix)
+
+    # Pages listing the roles a member holds, taken from the index rather than rendered again.
+    def member_pages(self, member, prefix):
+        held = self.role_ids.intersection(r.id for r in member.roles)
+        return goose_bot_utils.paginate([self.rendered[role_id] for role_id in sorted(held, key=self.positions.get)],
+                                        prefix)
+
+
+class RoleIndexCache:
+    def __init__(self, prefix="All roles:"):
+        self.prefix = prefix
+        self.indexes = {}  # guild_id -> GuildRoleIndex
+
+    def get(self, guild):
+        index = self.indexes.get(guild.id)
+        if index is None:
+            index = self.indexes[guild.id] = GuildRoleIndex(guild, self.prefix)
+        return index
+
+    def invalidate(self, guild_id):
+        self.indexes.pop(guild_id, None)
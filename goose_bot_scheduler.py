@@ -0,0 +1,202 @@
+# A single scheduler task for every recurring job the bot runs, such as the daily and hourly messages.
+# Jobs sit in a min-heap ordered by their next fire time, so any number of them costs one sleeping task.
+# The wall clock is read again on every wake so nothing drifts, and the time each job last fired is saved to disk
+# so a restart neither skips a job that was due nor sends it twice.
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+log = logging.getLogger("goose_bot.scheduler")
+
+# The longest the scheduler sleeps before checking the wall clock again, in case the clock jumped.
+MAX_SLEEP = 60
+
+
+# Parse one field of a cron expression, such as "*", "5", "1-5", "*/15" or "0,30", into the set of values it allows.
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        value_range, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if value_range == "*":
+            start, end = low, high
+        elif "-" in value_range:
+            start, end = map(int, value_range.split("-"))
+        else:
+            start = end = int(value_range)
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError("Cron field '" + field + "' is out of range.")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+# A job that fires at the times matched by a five-field cron expression (minute hour day month weekday), in UTC.
+class CronSchedule:
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expressions need five fields: minute hour day month weekday.")
+        self.expression = expression
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12)
+        # Cron counts weekdays from Sunday as 0 (or 7), Python from Monday as 0.
+        self.weekdays = {(day - 1) % 7 for day in parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def day_matches(self, moment):
+        day_match = moment.day in self.days
+        weekday_match = moment.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    # The first fire time strictly after the given timestamp.
+    def next_after(self, timestamp):
+        moment = datetime.fromtimestamp(timestamp, timezone.utc).replace(second=0, microsecond=0)
+        moment += timedelta(minutes=1)
+        # Skip whole months, days and hours that can't match rather than stepping minute by minute.
+        for _ in range(100000):
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                moment = moment.replace(year=moment.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self.day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError("Cron expression '" + self.expression + "' never fires.")
+
+
+# A job that fires every so many seconds, aligned to the Unix epoch so that e.g. hourly jobs land on the hour.
+class IntervalSchedule:
+    def __init__(self, seconds, offset=0):
+        if seconds <= 0:
+            raise ValueError("Intervals must be positive.")
+        self.seconds = seconds
+        self.offset = offset
+
+    def next_after(self, timestamp):
+        periods = (timestamp - self.offset) // self.seconds + 1
+        return self.offset + periods * self.seconds
+
+
+class ScheduledJob:
+    def __init__(self, name, schedule, callback, misfire_grace):
+        self.name = name
+        self.schedule = schedule
+        self.callback = callback
+        self.misfire_grace = misfire_grace
+        self.next_fire = None
+
+
+class Scheduler:
+    def __init__(self, file_name, clock=time.time):
+        self.file_name = file_name
+        self.clock = clock
+        self.jobs = {}
+        self.heap = []  # (next_fire, order, job)
+        self.order = itertools.count()
+        self.wake_up = asyncio.Event()
+        self.last_fired = {}
+        self.load()
+
+    # Register a job that fires on a cron expression, e.g. "0 19 * * *" for every day at 19:00 UTC.
+    # misfire_grace is how late, in seconds, a missed run may still be sent after a restart; None means always.
+    def add_cron_job(self, name, expression, callback, misfire_grace=None):
+        return self.add_job(name, CronSchedule(expression), callback, misfire_grace)
+
+    # Register a job that fires every interval seconds.
+    def add_interval_job(self, name, seconds, callback, misfire_grace=None, offset=0):
+        return self.add_job(name, IntervalSchedule(seconds, offset), callback, misfire_grace)
+
+    def add_job(self, name, schedule, callback, misfire_grace=None):
+        if name in self.jobs:
+            raise ValueError("A job named '" + name + "' is already scheduled.")
+        job = ScheduledJob(name, schedule, callback, misfire_grace)
+        self.jobs[name] = job
+        now = self.clock()
+        last_fired = self.last_fired.get(name)
+        if last_fired is None:
+            job.next_fire = schedule.next_after(now)
+        else:
+            # Catch up on a run missed while the bot was down, unless it is too stale to matter.
+            job.next_fire = schedule.next_after(last_fired)
+            if job.next_fire <= now and misfire_grace is not None and now - job.next_fire > misfire_grace:
+                job.next_fire = schedule.next_after(now)
+        self.push(job)
+        log.info("Job %s will first fire at %s.", name, datetime.fromtimestamp(job.next_fire, timezone.utc))
+        return job
+
+    def remove_job(self, name):
+        # The heap entry is dropped lazily when it comes up.
+        self.jobs.pop(name, None)
+
+    def push(self, job):
+        heapq.heappush(self.heap, (job.next_fire, next(self.order), job))
+        self.wake_up.set()
+
+    # Restore the time each job last fired.
+    def load(self):
+        try:
+            with open(self.file_name) as scheduler_file:
+                self.last_fired = {name: float(fired) for name, fired in json.load(scheduler_file).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError):
+            log.warning("Could not read job history from %s.", self.file_name)
+
+    def save(self):
+        temp_file_name = self.file_name + ".tmp"
+        try:
+            with open(temp_file_name, "w") as scheduler_file:
+                json.dump(self.last_fired, scheduler_file)
+            os.replace(temp_file_name, self.file_name)
+        except OSError:
+            log.warning("Could not save job history to %s.", self.file_name)
+
+    async def fire(self, job):
+        try:
+            await job.callback()
+        except Exception:
+            log.exception("Job %s failed.", job.name)
+
+    # Fire every job that is due. Returns how long to sleep until the next one.
+    def fire_due_jobs(self):
+        now = self.clock()
+        fired = False
+        while self.heap and self.heap[0][0] <= now:
+            fire_time, _, job = heapq.heappop(self.heap)
+            if self.jobs.get(job.name) is not job:
+                continue
+            asyncio.ensure_future(self.fire(job))
+            self.last_fired[job.name] = fire_time
+            fired = True
+            # Schedule from the fire time rather than from now, but never into the past.
+            job.next_fire = job.schedule.next_after(max(fire_time, now))
+            heapq.heappush(self.heap, (job.next_fire, next(self.order), job))
+        if fired:
+            self.save()
+        if not self.heap:
+            return MAX_SLEEP
+        return min(MAX_SLEEP, max(0, self.heap[0][0] - self.clock()))
+
+    async def run(self):
+        while True:
+            self.wake_up.clear()
+            timeout = self.fire_due_jobs()
+            try:
+                await asyncio.wait_for(self.wake_up.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,296 @@
+# Performance telemetry for the bot: command latency (up to the reply being sent) and event latency, event loop lag,
+# and Discord API accounting.
+# Everything is recorded with a clock read and a bisect into fixed histogram buckets, so it can stay on in production.
+# The numbers are shown by the .stats command and dumped as Prometheus text to a file and, optionally, a local port.
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from collections import Counter
+
+log = logging.getLogger("goose_bot.stats")
+
+# Histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_PROBE_INTERVAL = 0.5
+GATEWAY_SAMPLE_INTERVAL = 30
+RATE_LIMIT_MESSAGE = 'We are being rate limited.'
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    # Estimate a percentile (0-100) as the upper bound of the bucket it falls in.
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
+
+
+# Counts the rate limit warnings discord.py logs whenever Discord answers with a 429.
+class RateLimitCounter(logging.Handler):
+    def __init__(self, telemetry):
+        super().__init__(logging.WARNING)
+        self.telemetry = telemetry
+
+    def emit(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith(RATE_LIMIT_MESSAGE):
+            # The bucket is "channel_id:guild_id:path".
+            bucket = str(record.args[-1]) if record.args else ""
+            parts = bucket.split(":", 2)
+            self.telemetry.rate_limits[guild_label(parts[1] if len(parts) == 3 else None)] += 1
+
+
+def guild_label(guild_id):
+    return "none" if guild_id in (None, "None") else str(guild_id)
+
+
+class Telemetry:
+    def __init__(self, bot):
+        self.bot = bot
+        self.started = time.time()
+        self.commands = {}  # command name -> LatencyHistogram
+        self.command_errors = Counter()
+        self.events = {}  # event name -> LatencyHistogram
+        self.loop_lag = LatencyHistogram()
+        self.rest_calls = Counter()  # (method, path) -> calls
+        self.rest_calls_by_guild = Counter()
+        self.rest_errors = Counter()  # status -> errors
+        self.rest_latency = LatencyHistogram()
+        self.rate_limits = Counter()  # guild -> 429s
+        self.gateway_latency = {}  # guild -> seconds
+        self.extra = {}  # name -> callable returning a number, for other subsystems' counters
+
+    # Hook into the bot: every command, the HTTP client and discord.py's rate limit warnings.
+    def install(self):
+        self.bot.before_invoke(self.before_command)
+        self.bot.after_invoke(self.after_command)
+        self.wrap_http(self.bot.http)
+        logging.getLogger("discord.http").addHandler(RateLimitCounter(self))
+
+    def histogram(self, table, name):
+        histogram = table.get(name)
+        if histogram is None:
+            histogram = table[name] = LatencyHistogram()
+        return histogram
+
+    async def before_command(self, ctx):
+        ctx.telemetry_started = time.perf_counter()
+
+    # A command that queues its reply isn't finished until the reply has been sent, so its time is recorded then.
+    async def after_command(self, ctx):
+        started = getattr(ctx, "telemetry_started", None)
+        if started is None:
+            return
+        name = ctx.command.qualified_name
+        histogram = self.histogram(self.commands, name)
+        reply = getattr(ctx, "telemetry_reply", None)
+        if reply is None or reply.done():
+            histogram.record(time.perf_counter() - started)
+        else:
+            reply.add_done_callback(lambda sent: histogram.record(time.perf_counter() - started))
+        if ctx.command_failed:
+            self.command_errors[name] += 1
+
+    # Note a command's reply, given as a future that is done once it has been sent. Returns the future.
+    def track_reply(self, ctx, future):
+        ctx.telemetry_reply = future
+        return future
+
+    # Decorator recording how long an event handler takes. Use it under @goose_bot.event.
+    def timed_event(self, handler):
+        histogram = self.histogram(self.events, handler.__name__)
+
+        @functools.wraps(handler)
+        async def timed_handler(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                histogram.record(time.perf_counter() - started)
+        return timed_handler
+
+    # Count every REST call by route and guild, and time it, including any waiting on rate limits.
+    def wrap_http(self, http):
+        request = http.request
+
+        @functools.wraps(request)
+        async def counted_request(route, **kwargs):
+            self.rest_calls[(route.method, route.path)] += 1
+            guild_id = route.guild_id
+            if guild_id is None and route.channel_id is not None:
+                channel = self.bot.get_channel(int(route.channel_id))
+                guild_id = getattr(getattr(channel, "guild", None), "id", None)
+            self.rest_calls_by_guild[guild_label(guild_id)] += 1
+            started = time.perf_counter()
+            try:
+                return await request(route, **kwargs)
+            except Exception as error:
+                self.rest_errors[str(getattr(error, "status", type(error).__name__))] += 1
+                raise
+            finally:
+                self.rest_latency.record(time.perf_counter() - started)
+        http.request = counted_request
+
+    # Measure how late the event loop wakes a sleeping task; anything blocking the loop shows up here.
+    async def probe_loop_lag(self):
+        next_gateway_sample = 0
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.loop_lag.record(max(0.0, time.perf_counter() - started - LAG_PROBE_INTERVAL))
+            if started >= next_gateway_sample and self.bot.is_ready():
+                self.sample_gateway_latency()
+                next_gateway_sample = started + GATEWAY_SAMPLE_INTERVAL
+
+    def sample_gateway_latency(self):
+        shard_latencies = dict(getattr(self.bot, "latencies", ()))
+        for guild in self.bot.guilds:
+            self.gateway_latency[str(guild.id)] = shard_latencies.get(guild.shard_id, self.bot.latency)
+
+    def as_dict(self):
+        return {
+            "uptime": time.time() - self.started,
+            "commands": {name: h.as_dict() for name, h in self.commands.items()},
+            "command_errors": dict(self.command_errors),
+            "events": {name: h.as_dict() for name, h in self.events.items()},
+            "loop_lag": self.loop_lag.as_dict(),
+            "rest_calls": {method + " " + path: count for (method, path), count in self.rest_calls.items()},
+            "rest_calls_by_guild": dict(self.rest_calls_by_guild),
+            "rest_errors": dict(self.rest_errors),
+            "rest_latency": self.rest_latency.as_dict(),
+            "rate_limits": dict(self.rate_limits),
+            "gateway_latency": dict(self.gateway_latency),
+            "extra": {name: value() for name, value in self.extra.items()},
+        }
+
+    def prometheus_text(self):
+        lines = ["goose_bot_uptime_seconds " + repr(time.time() - self.started)]
+
+        def add_histogram(metric, histogram, labels=""):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                bound_label = "+Inf" if bound == float("inf") else repr(bound)
+                separator = "," if labels else ""
+                lines.append(metric + '_bucket{' + labels + separator + 'le="' + bound_label + '"} ' + str(cumulative))
+            braces = "{" + labels + "}" if labels else ""
+            lines.append(metric + "_sum" + braces + " " + repr(histogram.total))
+            lines.append(metric + "_count" + braces + " " + str(histogram.count))
+
+        for name, histogram in self.commands.items():
+            add_histogram("goose_bot_command_seconds", histogram, 'command="' + name + '"')
+        for name, count in self.command_errors.items():
+            lines.append('goose_bot_command_errors_total{command="' + name + '"} ' + str(count))
+        for name, histogram in self.events.items():
+            add_histogram("goose_bot_event_seconds", histogram, 'event="' + name + '"')
+        add_histogram("goose_bot_loop_lag_seconds", self.loop_lag)
+        add_histogram("goose_bot_rest_seconds", self.rest_latency)
+        for (method, path), count in self.rest_calls.items():
+            lines.append('goose_bot_rest_calls_total{method="' + method + '",path="' + path + '"} ' + str(count))
+        for guild, count in self.rest_calls_by_guild.items():
+            lines.append('goose_bot_rest_calls_by_guild_total{guild="' + guild + '"} ' + str(count))
+        for status, count in self.rest_errors.items():
+            lines.append('goose_bot_rest_errors_total{status="' + status + '"} ' + str(count))
+        for guild, count in self.rate_limits.items():
+            lines.append('goose_bot_rate_limits_total{guild="' + guild + '"} ' + str(count))
+        for guild, latency in self.gateway_latency.items():
+            lines.append('goose_bot_gateway_latency_seconds{guild="' + guild + '"} ' + repr(latency))
+        for name, value in self.extra.items():
+            lines.append("goose_bot_" + name + " " + str(value()))
+        return "\n".join(lines) + "\n"
+
+    # A short, human readable summary for the .stats command.
+    def summary(self):
+        def line(name, histogram):
+            return ("%-24s n=%-6d p50=%7.1fms p99=%7.1fms max=%7.1fms"
+                    % (name[:24], histogram.count, histogram.percentile(50) * 1000,
+                       histogram.percentile(99) * 1000, histogram.maximum * 1000))
+
+        uptime = int(time.time() - self.started)
+        lines = ["Uptime: %dh %dm" % (uptime // 3600, uptime % 3600 // 60), line("event loop lag", self.loop_lag)]
+        lines += [line("." + name, h) for name, h in sorted(self.commands.items())]
+        lines += [line(name, h) for name, h in sorted(self.events.items())]
+        lines.append(line("REST calls", self.rest_latency))
+        lines.append("429s: %d, REST errors: %d, command errors: %d"
+                     % (sum(self.rate_limits.values()), sum(self.rest_errors.values()),
+                        sum(self.command_errors.values())))
+        if self.gateway_latency:
+            latencies = self.gateway_latency.values()
+            lines.append("Gateway latency: %.0f-%.0fms over %d guilds"
+                         % (min(latencies) * 1000, max(latencies) * 1000, len(self.gateway_latency)))
+        lines += [name + ": " + str(value()) for name, value in self.extra.items()]
+        return "\n".join(lines)
+
+    # Periodically write the Prometheus text to a file, off the event loop.
+    async def dump_to_file(self, file_name, interval=60):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval)
+            text = self.prometheus_text()
+            try:
+                await loop.run_in_executor(None, write_file, file_name, text)
+            except OSError:
+                log.warning("Could not write stats to %s.", file_name)
+
+    # Serve /metrics (Prometheus text) and /stats.json on a local port.
+    async def serve(self, port, host="127.0.0.1"):
+        from aiohttp import web
+
+        async def metrics(request):
+            return web.Response(text=self.prometheus_text(), content_type="text/plain")
+
+        async def stats_json(request):
+            return web.Response(text=json.dumps(self.as_dict()), content_type="application/json")
+
+        app = web.Application()
+        app.router.add_get("/metrics", metrics)
+        app.router.add_get("/stats.json", stats_json)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        log.info("Serving stats on http://%s:%d/metrics.", host, port)
+
+    def start(self, stats_file_name=None, port=None):
+        self.bot.loop.create_task(self.probe_loop_lag())
+        if stats_file_name:
+            self.bot.loop.create_task(self.dump_to_file(stats_file_name))
+        if port:
+            self.bot.loop.create_task(self.serve(port))
+
+
+def write_file(file_name, text):
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, "w") as stats_file:
+        stats_file.write(text)
+    os.replace(temp_file_name, file_name)
@@ -0,0 +1,259 @@
+# Daily tips: a compact on-disk tip store, keyword search over it and a no-repeat rotation per channel.
+# Tips are written one per line in a text file, which is compiled into a binary store of offsets and UTF-8 text.
+# The store is memory-mapped, so only the tips that are actually read get paged in, and the keyword index is built
+# in a worker thread once the bot is ready, so no search has to wait on the event loop for it.
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import random
+import re
+import struct
+import threading
+import time
+import unicodedata
+from array import array
+
+log = logging.getLogger("goose_bot.tips")
+
+# The store is MAGIC, the number of tips, count + 1 offsets into the text that follows, then the tips' UTF-8 text.
+STORE_MAGIC = b"GTIP"
+STORE_HEADER = struct.Struct("<4sI")
+STORE_OFFSET = struct.Struct("<I")
+WORD_PATTERN = re.compile(r"\w+")
+INDEX_YIELD_EVERY = 50  # Tips indexed between letting the event loop's thread take the GIL.
+
+
+# Lower case, strip accents (so "pokemon" finds "Pokémon") and drop plural s's, for indexing and searching alike.
+def normalise_words(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    words = []
+    for word in WORD_PATTERN.findall(text):
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+# Read the tips from a text file with one tip per line, skipping blank lines and # comments.
+def read_tip_source(file_name):
+    with open(file_name, encoding="utf-8") as source_file:
+        return [line.strip() for line in source_file if line.strip() and not line.lstrip().startswith("#")]
+
+
+def write_tip_store(file_name, tips):
+    encoded = [tip.encode("utf-8") for tip in tips]
+    offsets = [0]
+    for tip in encoded:
+        offsets.append(offsets[-1] + len(tip))
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, "wb") as store_file:
+        store_file.write(STORE_HEADER.pack(STORE_MAGIC, len(encoded)))
+        store_file.write(struct.pack("<%dI" % len(offsets), *offsets))
+        store_file.write(b"".join(encoded))
+    os.replace(temp_file_name, file_name)
+
+
+class TipStore:
+    def __init__(self, source_file_name, store_file_name=None):
+        self.source_file_name = source_file_name
+        self.store_file_name = store_file_name or os.path.splitext(source_file_name)[0] + ".store"
+        self.mapped = None
+        self.count = 0
+        self.text_start = 0
+        self.loaded = False
+        self.load_lock = threading.Lock()  # The index is built in a worker thread, which loads the store too.
+        self.words = None  # word -> tuple of tip numbers, built by build_index
+
+    # Compile the store if the text file is newer, then map it. Does nothing after the first call.
+    def load(self):
+        if self.loaded:
+            return
+        with self.load_lock:
+            if not self.loaded:
+                self.map_store()
+                self.loaded = True
+
+    def map_store(self):
+        try:
+            source_mtime = os.stat(self.source_file_name).st_mtime
+        except OSError:
+            source_mtime = None
+        try:
+            store_mtime = os.stat(self.store_file_name).st_mtime
+        except OSError:
+            store_mtime = None
+        if source_mtime is not None and (store_mtime is None or source_mtime > store_mtime):
+            try:
+                tips = read_tip_source(self.source_file_name)
+                write_tip_store(self.store_file_name, tips)
+            except (OSError, UnicodeDecodeError):
+                log.warning("Could not compile the tips in %s.", self.source_file_name)
+            else:
+                log.info("Compiled %d tips from %s.", len(tips), self.source_file_name)
+        try:
+            with open(self.store_file_name, "rb") as store_file:
+                mapped = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            log.warning("No tips available; %s could not be opened.", self.store_file_name)
+            return
+        magic, count = STORE_HEADER.unpack_from(mapped, 0) if len(mapped) >= STORE_HEADER.size else (None, 0)
+        if magic != STORE_MAGIC:
+            log.warning("%s is not a tip store.", self.store_file_name)
+            mapped.close()
+            return
+        self.mapped = mapped
+        self.count = count
+        self.text_start = STORE_HEADER.size + (count + 1) * STORE_OFFSET.size
+
+    def __len__(self):
+        self.load()
+        return self.count
+
+    def tip(self, number):
+        self.load()
+        if not 0 <= number < self.count:
+            raise IndexError(number)
+        offset_position = STORE_HEADER.size + number * STORE_OFFSET.size
+        start, = STORE_OFFSET.unpack_from(self.mapped, offset_position)
+        end, = STORE_OFFSET.unpack_from(self.mapped, offset_position + STORE_OFFSET.size)
+        return self.mapped[self.text_start + start:self.text_start + end].decode("utf-8")
+
+    # Map every word to the tips that contain it. Runs in a worker thread, which regularly lets go of the GIL so the
+    # event loop doesn't wait out a whole switch interval every time it comes back from I/O.
+    def build_index(self):
+        postings = {}
+        for number in range(len(self)):
+            if number % INDEX_YIELD_EVERY == 0:
+                time.sleep(0)
+            for word in set(normalise_words(self.tip(number))):
+                postings.setdefault(word, []).append(number)
+        self.words = {word: tuple(numbers) for word, numbers in postings.items()}
+        log.info("Indexed %d words in %d tips.", len(self.words), self.count)
+
+    # Numbers of the tips containing every word of the query, in store order. Needs the index from build_index.
+    def search(self, query):
+        query_words = set(normalise_words(query))
+        if not query_words:
+            return []
+        postings = sorted((self.words.get(word, ()) for word in query_words), key=len)
+        matches = set(postings[0])
+        for numbers in postings[1:]:
+            if not matches:
+                break
+            matches.intersection_update(numbers)
+        return sorted(matches)
+
+
+# A shuffled order of every tip for each channel, so a channel sees each tip once before any repeats.
+# Only a seed and a position are saved per channel; the order itself is shuffled again from the seed after a restart.
+# Entries saved before the order was drawn lazily don't say which shuffle they used, and start a fresh cycle.
+ORDER_VERSION = 2
+SAVE_DELAY = 1  # Seconds to gather rotation changes before writing them out together.
+
+
+# A seeded Fisher-Yates shuffle carried only as far as it has been read, so a channel's first tip doesn't cost a
+# shuffle of every tip.
+class TipOrder:
+    def __init__(self, count, seed):
+        self.numbers = array("I", range(count))
+        self.random = random.Random(seed)
+        self.drawn = 0
+
+    def __getitem__(self, position):
+        numbers = self.numbers
+        while self.drawn <= position:
+            swap = self.random.randrange(self.drawn, len(numbers))
+            numbers[self.drawn], numbers[swap] = numbers[swap], numbers[self.drawn]
+            self.drawn += 1
+        return numbers[position]
+
+
+class TipRotation:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.channels = {}  # channel_id -> {"seed": int, "position": int, "count": int, "version": int}
+        self.orders = {}  # channel_id -> TipOrder
+        self.save_timer = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.file_name) as rotation_file:
+                entries = json.load(rotation_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            log.warning("Could not read the tip rotation from %s.", self.file_name)
+            return
+        self.channels = {int(channel_id): entry for channel_id, entry in entries.items()}
+
+    def save(self):
+        self.save_timer = None
+        temp_file_name = self.file_name + ".tmp"
+        try:
+            with open(temp_file_name, "w") as rotation_file:
+                rotation_file.write(json.dumps(self.channels))
+            os.replace(temp_file_name, self.file_name)
+        except OSError:
+            log.warning("Could not save the tip rotation to %s.", self.file_name)
+
+    def order(self, channel_id, entry):
+        order = self.orders.get(channel_id)
+        if order is None:
+            order = self.orders[channel_id] = TipOrder(entry["count"], entry["seed"])
+        return order
+
+    # Start a new pass over the tips, reshuffling if it would open with the tip that closed the last one.
+    def start_cycle(self, channel_id, count, last_tip=None):
+        while True:
+            entry = self.channels[channel_id] = {"seed": random.getrandbits(32), "position": 0, "count": count,
+                                                 "version": ORDER_VERSION}
+            self.orders.pop(channel_id, None)
+            if count < 2 or self.order(channel_id, entry)[0] != last_tip:
+                return entry
+
+    # The next tip number for a channel. A store that has grown or shrunk starts a fresh cycle.
+    def next_tip(self, channel_id, count):
+        entry = self.channels.get(channel_id)
+        if entry is None or entry["count"] != count or entry.get("version") != ORDER_VERSION:
+            entry = self.start_cycle(channel_id, count)
+        elif entry["position"] >= count:
+            entry = self.start_cycle(channel_id, count, self.order(channel_id, entry)[count - 1])
+        number = self.order(channel_id, entry)[entry["position"]]
+        entry["position"] += 1
+        if self.save_timer is None:
+            self.save_timer = asyncio.get_event_loop().call_later(SAVE_DELAY, self.save)
+        return number
+
+
+class TipEngine:
+    def __init__(self, source_file_name, rotation_file_name):
+        self.store = TipStore(source_file_name)
+        self.rotation = TipRotation(rotation_file_name)
+        self.indexing = None  # Future for the keyword index, built in a worker thread
+
+    # Start building the keyword index off the event loop. Does nothing if it has already been started.
+    def start_indexing(self, loop):
+        if self.indexing is None:
+            self.indexing = loop.run_in_executor(None, self.store.build_index)
+
+    # The next tip in a channel's rotation, or None if there are no tips.
+    def next_tip(self, channel_id):
+        count = len(self.store)
+        if not count:
+            return None
+        return self.store.tip(self.rotation.next_tip(channel_id, count))
+
+    # The first `limit` tips matching a query and how many matched, once the index is ready.
+    async def search(self, query, limit=3):
+        if self.indexing is None:
+            self.start_indexing(asyncio.get_event_loop())
+        await asyncio.shield(self.indexing)
+        numbers = self.store.search(query)
+        return [self.store.tip(number) for number in numbers[:limit]], len(numbers)
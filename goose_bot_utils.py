@@ -1,37 +1,89 @@
-import random
-from math import floor
+import asyncio
 
+import discord
 
-async def roll_result(limit, rolls):
-    result = ', '.join(str(random.randint(1, limit)) for r in range(rolls))
-    print(result)
-    no_spaces = result.replace(" ", "")
-    dice = no_spaces.split(",")
-    roll_sum = 0
-    for element in dice:
-        if isinstance(element, int) or element.isdigit():
-            roll_sum += int(element)
-    roll_sum = str(roll_sum)
-    result = result + ' (' + roll_sum + ')'
-    return result
 
+MESSAGE_LIMIT = 2000
+PAGE_FOOTER_SPACE = 20  # Room left on each page for a "(page 1/10)" footer.
+PREVIOUS_PAGE = '◀️'
+NEXT_PAGE = '▶️'
+PAGE_TIMEOUT = 120  # Seconds a paginated message keeps listening for page turns.
 
-async def prettify_roles(role_list, prefix):
-    pretty_roles = prefix + "\n"
-    for r in role_list:
-        r = '`' + r.name.replace("@", "") + '`'
-        pretty_roles += r + ","
-    return pretty_roles[:-1]
+
+# Split a list of items into pages of at most MESSAGE_LIMIT characters, each built with a single join.
+def paginate(items, prefix, separator=","):
+    page_limit = MESSAGE_LIMIT - PAGE_FOOTER_SPACE - len(prefix) - 1
+    pages = []
+    start = 0
+    length = 0
+    for i, item in enumerate(items):
+        item_length = len(item) + len(separator)
+        if length + item_length > page_limit and i > start:
+            pages.append(prefix + "\n" + separator.join(items[start:i]))
+            start = i
+            length = 0
+        length += item_length
+    pages.append(prefix + "\n" + separator.join(items[start:]))
+    return pages
+
+
+def page_text(pages, page):
+    if len(pages) == 1:
+        return pages[0]
+    return pages[page] + "\n(page " + str(page + 1) + "/" + str(len(pages)) + ")"
+
+
+# Join consecutive pages wherever they fit in one message, so short listings go out together.
+def merge_pages(pages):
+    merged = [pages[0]]
+    for page in pages[1:]:
+        if len(merged[-1]) + 2 + len(page) <= MESSAGE_LIMIT - PAGE_FOOTER_SPACE:
+            merged[-1] += "\n\n" + page
+        else:
+            merged.append(page)
+    return merged
+
+
+# Queue the first of a list of pages. The author can flip through the rest with reactions for a while afterwards.
+# Returns the outbox's future for the message.
+def send_pages(ctx, outbox, pages, priority):
+    if len(pages) == 1:
+        return outbox.send(ctx.channel, pages[0], priority)
+
+    def start_turning_pages(future):
+        if future.result() is not None:
+            ctx.bot.loop.create_task(turn_pages(ctx, future.result(), pages))
+
+    future = outbox.send(ctx.channel, page_text(pages, 0), priority, coalesce=False)
+    future.add_done_callback(start_turning_pages)
+    return future
+
+
+async def turn_pages(ctx, message, pages):
+    try:
+        await message.add_reaction(PREVIOUS_PAGE)
+        await message.add_reaction(NEXT_PAGE)
+    except discord.HTTPException:
+        return
+
+    def is_page_turn(payload):
+        return (payload.message_id == message.id and payload.user_id == ctx.author.id
+                and str(payload.emoji) in (PREVIOUS_PAGE, NEXT_PAGE))
+
+    page = 0
+    while True:
+        try:
+            payload = await ctx.bot.wait_for('raw_reaction_add', check=is_page_turn, timeout=PAGE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return
+        page = (page + (1 if str(payload.emoji) == NEXT_PAGE else -1)) % len(pages)
+        try:
+            await message.edit(content=page_text(pages, page))
+            await message.remove_reaction(payload.emoji, ctx.author)
+        except discord.HTTPException:
+            pass
 
 
 async def prettify_role(role_name: str):
     role_name = '`' + role_name.name.replace("@", "") + '`'
     return role_name
-
-
-async def make_time_str(seconds):
-    minutes = floor(seconds / 60)
-    hours = floor(minutes / 60)
-    minutes = minutes - hours * 60
-    sec = (seconds - minutes * 60) - hours * 3600
-    return str(floor(hours)) + " hours, " + str(floor(minutes)) + " minutes, and " + str(floor(sec)) + " seconds"